@@ -4,9 +4,14 @@ from flask.ext.login import LoginManager
 from flask.ext.mail import Mail
 from flask.ext.moment import Moment
 from flask.ext.pagedown import PageDown
-from flask.ext.sqlalchemy import SQLAlchemy
 
 from config import config
+from .engine import EngineTuning, SQLAlchemy
+from .follow_graph import FollowGraph
+from .fragments import FragmentCache
+from .instrumentation import Instrumentation
+from .last_seen import LastSeenBuffer
+from .rendering import RenderCache
 
 bootstrap = Bootstrap()
 moment = Moment()
@@ -16,6 +21,12 @@ login_manager = LoginManager()
 login_manager.session_protection = 'strong'
 login_manager.login_view = 'auth.login'
 pagedown = PageDown()
+engine_tuning = EngineTuning(db)
+render_cache = RenderCache()
+fragment_cache = FragmentCache()
+last_seen_buffer = LastSeenBuffer(db)
+follow_graph = FollowGraph(db)
+instrumentation = Instrumentation(db)
 
 
 def create_app(config_name):
@@ -27,8 +38,17 @@ def create_app(config_name):
     mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
+    engine_tuning.init_app(app)
     login_manager.init_app(app)
     pagedown.init_app(app)
+    render_cache.init_app(app)
+    fragment_cache.init_app(app)
+    last_seen_buffer.init_app(app)
+    follow_graph.init_app(app)
+    instrumentation.init_app(app)
+
+    from .email import mail_pool
+    mail_pool.init_app(app)
 
     #  Routes and custom error pages goes here.
     from .main import main as main_blueprint
@@ -1,14 +1,61 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import hashlib
+import hmac
+import os
+
 from flask import g, jsonify
 from flask.ext.httpauth import HTTPBasicAuth
 
 from . import api
 from .errors import unauthorized, forbidden
+from .. import db
+from ..cache import LRUCache
 from ..models import AnonymousUser, User
 
 auth = HTTPBasicAuth()
+_MISSING = object()
+
+
+class CredentialCache(object):
+    """Short-lived record of successful email+password checks, so repeat requests skip the password KDF.
+
+    Entries are keyed on the email and an HMAC of the password under a per-process key, never the password itself,
+    and remember the hash they were verified against: a changed hash misses even in processes that never saw the
+    change.  Local changes to a user's email or password also drop the entries right away.  Users without a password
+    never authenticate.
+    """
+
+    def __init__(self):
+        self.cache = LRUCache()
+        self.key = os.urandom(32)
+
+    def init_app(self, app):
+        self.cache.resize(app.config['FLASKY_AUTH_CACHE_SIZE'], ttl=app.config['FLASKY_AUTH_CACHE_TTL'])
+
+    def verify(self, user, password):
+        if user.password_hash is None:
+            return False
+        key = (user.email, hmac.new(self.key, password.encode('utf-8'), hashlib.sha256).hexdigest())
+        cached = self.cache.get(key, _MISSING)
+        if cached is not _MISSING and cached == user.password_hash:
+            return True
+        if not user.verify_password(password):
+            return False
+        self.cache.set(key, user.password_hash)
+        return True
+
+    def invalidate(self, email):
+        for key in self.cache.keys():
+            if key[0] == email:
+                self.cache.pop(key)
+
+
+credential_cache = CredentialCache()
+api.record_once(lambda state: credential_cache.init_app(state.app))
+db.event.listen(User.email, 'set', lambda target, value, oldvalue, _: credential_cache.invalidate(oldvalue))
+db.event.listen(User.password_hash, 'set', lambda target, *_: credential_cache.invalidate(target.email))
 
 
 @auth.verify_password
@@ -27,7 +74,7 @@ def verify_password(email_or_token, password):
 
     g.current_user = user
     g.token_used = False
-    return user.verify_password(password)
+    return credential_cache.verify(user, password)
 
 
 @auth.error_handler
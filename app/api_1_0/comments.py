@@ -1,28 +1,32 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from flask import jsonify, request, g, url_for, current_app
+from flask import jsonify, request, g, url_for
 
 from . import api
+from .decorators import permission_required
+from .pagination import paginate
+from .representation import Representation, multi_get
 from .. import db
-from ..decorators import permission_required
+from ..conditional import make_etag, not_modified
 from ..models import Comment, Post, Permission
 
 
 @api.route('/comments/')
 def get_comments():
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page, per_page, error_out=False)
-    comments = pagination.items
-    _prev = None if not pagination.has_prev else url_for('api.get_posts', page=page - 1, _external=True)
-    _next = None if not pagination.has_next else url_for('api.get_posts', page=page + 1, _external=True)
+    if 'ids' in request.args:
+        return multi_get(Comment, 'comments')
+    page = paginate(Comment.query.order_by(Comment.timestamp.desc()), 'api.get_comments',
+                    (Comment.timestamp, Comment.id))
+    view = Representation(Comment, page.items)
+    response = not_modified(page.etag(view.version))
+    if response is not None:
+        return response
     response = {
-        'comments': [comment.json for comment in comments],
-        'prev': _prev,
-        'next': _next,
-        'count': pagination.total
+        'comments': view.json(),
+        'prev': page.prev,
+        'next': page.next,
+        'count': page.count
     }
     return jsonify(response)
 
@@ -30,25 +34,29 @@ def get_comments():
 @api.route('/comments/<int:comment_id>')
 def get_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
-    return jsonify(comment.json)
+    view = Representation(Comment, [comment])
+    # embedded rows can change after the comment was written
+    response = not_modified(make_etag(view.version), None if view.embeds else comment.timestamp)
+    if response is not None:
+        return response
+    return jsonify(view.json()[0])
 
 
 @api.route('/posts/<int:post_id>/comments/')
 def get_post_comments(post_id):
     post = Post.query.get_or_404(post_id)
 
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(page, per_page, error_out=False)
-    comments = pagination.items
-    _prev = None if not pagination.has_prev else url_for('api.get_posts', page=page - 1, _external=True)
-    _next = None if not pagination.has_next else url_for('api.get_posts', page=page + 1, _external=True)
+    page = paginate(post.comments.order_by(Comment.timestamp.asc()), 'api.get_post_comments',
+                    (Comment.timestamp, Comment.id), ascending=True, post_id=post_id)
+    view = Representation(Comment, page.items)
+    response = not_modified(page.etag(view.version))
+    if response is not None:
+        return response
     response = {
-        'comments': [comment.json for comment in comments],
-        'prev': _prev,
-        'next': _next,
-        'count': pagination.total
+        'comments': view.json(),
+        'prev': page.prev,
+        'next': page.next,
+        'count': page.count
     }
     return jsonify(response)
 
@@ -58,7 +66,7 @@ def get_post_comments(post_id):
 def new_post_comment(post_id):
     post = Post.query.get_or_404(post_id)
     comment = Comment.from_json(request.json)
-    comment.author = g.current_user
+    comment.author_id = g.current_user.id
     comment.post = post
     db.session.add(comment)
     db.session.commit()
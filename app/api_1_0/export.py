@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from flask import Response, request, stream_with_context
+
+from . import api
+from .decorators import permission_required
+from ..export import export_ndjson
+from ..models import Permission
+
+
+@api.route('/export/<any(posts, comments):name>')
+@permission_required(Permission.ADMIN)
+def export(name):
+    rows = export_ndjson(name, request.args.get('since'))
+    return Response(stream_with_context(rows), mimetype='application/x-ndjson')
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from datetime import datetime
+
+from flask import current_app, request, url_for
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_
+
+from ..conditional import make_etag
+from ..exceptions import ValidationError
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class Page(object):
+    def __init__(self, items, prev=None, next=None, count=None):
+        self.items = items
+        self.prev = prev
+        self.next = next
+        self.count = count
+
+    def etag(self, version):
+        """ETag of this page rendered as `version`, e.g. a :attr:`Representation.version`."""
+        return make_etag(version, self.prev, self.next, self.count)
+
+
+def paginate(query, endpoint, keyset, ascending=False, **values):
+    """Return a :class:`Page` of `query` for the api list `endpoint`.
+
+    Clients page with `?page=N` (OFFSET/LIMIT) by default.  Passing `?cursor=` switches to keyset pagination on
+    `keyset`, a `(timestamp, id)` column pair, and the `prev`/`next` links then carry opaque cursors instead of page
+    numbers, so every page costs the same no matter how deep it is.  `?count=0` skips the `COUNT(*)` in both modes.
+    A `keyset` of None, for queries not ordered by time, keeps offset pagination.
+    """
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+    with_count = request.args.get('count', '1').lower() not in ('0', 'false', 'no')
+    if not with_count:
+        values['count'] = 0
+
+    if keyset is not None and request.args.get('cursor') is not None:
+        page = _keyset_page(query, endpoint, keyset, ascending, per_page, values)
+    else:
+        page = _offset_page(query, endpoint, per_page, with_count, values)
+
+    if with_count:
+        page.count = query.order_by(None).count() if page.count is None else page.count
+    return page
+
+
+def _offset_page(query, endpoint, per_page, with_count, values):
+    page = request.args.get('page', 1, type=int)
+    if with_count:
+        pagination = query.paginate(page, per_page, error_out=False)
+        items, has_prev, has_next, count = pagination.items, pagination.has_prev, pagination.has_next, pagination.total
+    else:
+        items = query.limit(per_page + 1).offset(max(page - 1, 0) * per_page).all()
+        has_prev, has_next, count = page > 1, len(items) > per_page, None
+        items = items[:per_page]
+
+    _prev = None if not has_prev else url_for(endpoint, page=page - 1, _external=True, **values)
+    _next = None if not has_next else url_for(endpoint, page=page + 1, _external=True, **values)
+    return Page(items, _prev, _next, count)
+
+
+def _keyset_page(query, endpoint, keyset, ascending, per_page, values):
+    timestamp, id_ = keyset
+    cursor = request.args.get('cursor')
+    position, backwards = decode_cursor(cursor) if cursor else (None, False)
+
+    # Reading backwards walks the index in the opposite direction and flips the page afterwards.
+    forward = ascending != backwards
+    if position:
+        last_timestamp, last_id = position
+        if forward:
+            query = query.filter(or_(timestamp > last_timestamp, and_(timestamp == last_timestamp, id_ > last_id)))
+        else:
+            query = query.filter(or_(timestamp < last_timestamp, and_(timestamp == last_timestamp, id_ < last_id)))
+    order = (timestamp.asc(), id_.asc()) if forward else (timestamp.desc(), id_.desc())
+
+    items = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    has_prev = has_more if backwards else position is not None
+    has_next = True if backwards else has_more
+    _prev = None if not (has_prev and items) else url_for(endpoint, cursor=encode_cursor(items[0], backwards=True),
+                                                          _external=True, **values)
+    _next = None if not (has_next and items) else url_for(endpoint, cursor=encode_cursor(items[-1]), _external=True,
+                                                          **values)
+    return Page(items, _prev, _next)
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='api-cursor')
+
+
+def encode_cursor(item, backwards=False):
+    return _serializer().dumps([item.timestamp.strftime(TIMESTAMP_FORMAT), item.id, backwards])
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, id_, backwards = _serializer().loads(cursor)
+        return (datetime.strptime(timestamp, TIMESTAMP_FORMAT), int(id_)), bool(backwards)
+    except (BadSignature, TypeError, ValueError):
+        raise ValidationError('invalid cursor')
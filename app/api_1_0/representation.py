@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from collections import OrderedDict, defaultdict
+
+from flask import current_app, g, jsonify, request
+
+from .. import db
+from ..conditional import make_etag, not_modified
+from ..exceptions import ValidationError
+from ..models import Comment, Post, User, preload
+
+
+def _many_to_one(name):
+    def load(items):
+        preload(items, name)
+        return [getattr(item, name) for item in items]
+
+    return load
+
+
+def _post_comments(posts):
+    """The newest `FLASKY_COMMENTS_PER_PAGE` comments of each post, newest first."""
+    by_post = defaultdict(list)
+    if posts:
+        newest_first = (Comment.timestamp.desc(), Comment.id.desc())
+        ranked = db.session.query(Comment.id.label('id'), db.func.row_number().over(
+            partition_by=Comment.post_id, order_by=newest_first).label('rank')).filter(
+            Comment.post_id.in_([post.id for post in posts])).subquery()
+        comments = Comment.query.join(ranked, Comment.id == ranked.c.id).filter(
+            ranked.c.rank <= current_app.config['FLASKY_COMMENTS_PER_PAGE'])
+        for comment in comments.order_by(*newest_first):
+            by_post[comment.post_id].append(comment)
+    return [by_post[post.id] for post in posts]
+
+
+def _followed_by_me(users):
+    status = g.current_user.following_status(users)
+    return [status[user.id].following for user in users]
+
+
+VIEWER_FIELDS = {
+    User: {'followed_by_me': _followed_by_me},
+    Post: {},
+    Comment: {},
+}
+
+EMBEDS = {
+    User: {},
+    Post: {'author': _many_to_one('author'), 'comments': _post_comments},
+    Comment: {'author': _many_to_one('author'), 'post': _many_to_one('post')},
+}
+
+
+class Representation(object):
+    """The `?fields=` and `?embed=` view of `items`, a list of `model` rows.
+
+    `?fields=body,timestamp` limits the keys computed per row.  `?embed=author,comments` replaces those keys' urls with
+    the related resources, loaded with one batched query per relation for the whole list.  An embedded list may be a
+    first page only, so its url stays next to it as `comments_url`.  Unknown names are a 400.
+    Fields in `VIEWER_FIELDS` depend on `g.current_user` and are likewise computed for the whole list at once.
+    """
+
+    def __init__(self, model, items):
+        self.model = model
+        self.items = items
+        names = self._names('fields', list(model.JSON_FIELDS) + list(VIEWER_FIELDS[model]))
+        self.fields = [name for name in names if name in model.JSON_FIELDS] if names else None
+        self.viewer_fields = [(name, VIEWER_FIELDS[model][name](items))
+                              for name in VIEWER_FIELDS[model] if not names or name in names]
+        self.embeds = [(name, EMBEDS[model][name](items)) for name in self._names('embed', EMBEDS[model])]
+
+    @staticmethod
+    def _names(arg, allowed):
+        names = [name for name in request.args.get(arg, '').split(',') if name]
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise ValidationError('unknown %s: %s' % (arg, ', '.join(unknown)))
+        return names
+
+    @property
+    def version(self):
+        """What :meth:`json` depends on, for validators."""
+        return (self.fields, [item.version for item in self.items], self.viewer_fields,
+                [(name, [_map(related, lambda row: row.version) for related in embedded])
+                 for name, embedded in self.embeds])
+
+    def json(self):
+        rows = [item.to_json(self.fields) for item in self.items]
+        for name, values in self.viewer_fields:
+            for row, value in zip(rows, values):
+                row[name] = value
+        for name, embedded in self.embeds:
+            for row, item, related in zip(rows, self.items, embedded):
+                row[name] = _map(related, lambda each: each.json)
+                if isinstance(related, list):
+                    row[name + '_url'] = self.model.JSON_FIELDS[name](item)
+        return rows
+
+
+def _map(related, func):
+    if related is None:
+        return None
+    if isinstance(related, list):
+        return [func(item) for item in related]
+    return func(related)
+
+
+def multi_get(model, key):
+    """Respond to `?ids=3,1,2` with those `model` rows, in that order, from one IN query.
+
+    Ids with no row are listed under `missing`.  More than `FLASKY_API_MAX_IDS` ids is a 400.
+    """
+    try:
+        ids = [int(id_) for id_ in request.args.get('ids', '').split(',') if id_]
+    except ValueError:
+        raise ValidationError('ids must be integers')
+    if not ids:
+        raise ValidationError('no ids given')
+    ids = list(OrderedDict.fromkeys(ids))
+    if len(ids) > current_app.config['FLASKY_API_MAX_IDS']:
+        raise ValidationError('at most %d ids per request' % current_app.config['FLASKY_API_MAX_IDS'])
+
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ids))}
+    view = Representation(model, [rows[id_] for id_ in ids if id_ in rows])
+    missing = [id_ for id_ in ids if id_ not in rows]
+    response = not_modified(make_etag(view.version, missing))
+    if response is not None:
+        return response
+    return jsonify({key: view.json(), 'missing': missing})
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from flask import jsonify, request
+
+from . import api
+from .pagination import paginate
+from .representation import Representation
+from ..conditional import not_modified
+from ..exceptions import ValidationError
+from ..models import Comment
+from ..search import indexes
+
+
+@api.route('/search')
+def search():
+    q = request.args.get('q', '')
+    type_ = request.args.get('type', 'posts')
+    if type_ not in indexes:
+        raise ValidationError('type must be one of: %s' % ', '.join(sorted(indexes)))
+    query = indexes[type_].search(q)
+    if type_ == 'comments':
+        query = query.filter(Comment.disabled.isnot(True))
+
+    page = paginate(query, 'api.search', None, q=q, type=type_)
+    view = Representation(indexes[type_].model, page.items)
+    response = not_modified(page.etag(view.version))
+    if response is not None:
+        return response
+    return jsonify({type_: view.json(), 'prev': page.prev, 'next': page.next, 'count': page.count})
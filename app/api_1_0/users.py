@@ -1,41 +1,49 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from flask import jsonify, request, current_app, url_for
+from flask import jsonify
 
 from . import api
-from ..models import User, Post
+from .pagination import paginate
+from .representation import Representation, multi_get
+from ..conditional import make_etag, not_modified
+from ..models import User, Post, TimelineEntry
+
+
+@api.route('/users/')
+def get_users():
+    return multi_get(User, 'users')
 
 
 @api.route('/users/<int:user_id>')
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
-    return jsonify(user.json)
+    view = Representation(User, [user])
+    response = not_modified(make_etag(view.version))
+    if response is not None:
+        return response
+    return jsonify(view.json()[0])
 
 
 @api.route('/users/<int:user_id>/posts/')
 def get_user_posts(user_id):
     user = User.query.get_or_404(user_id)
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=False)
-    posts = pagination.items
-    _prev = None if not pagination.has_prev else url_for('api.get_posts', page=page - 1, _external=True)
-    _next = None if not pagination.has_next else url_for('api.get_posts', page=page + 1, _external=True)
-
-    return jsonify({'posts': [post.json for post in posts], 'prev': _prev, 'next': _next, 'count': pagination.total})
+    page = paginate(user.posts.order_by(Post.timestamp.desc()), 'api.get_user_posts', (Post.timestamp, Post.id),
+                    user_id=user_id)
+    view = Representation(Post, page.items)
+    response = not_modified(page.etag(view.version))
+    if response is not None:
+        return response
+    return jsonify({'posts': view.json(), 'prev': page.prev, 'next': page.next, 'count': page.count})
 
 
 @api.route('/users/<int:user_id>/timeline/')
 def get_user_followed_posts(user_id):
     user = User.query.get_or_404(user_id)
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
-
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=False)
-    posts = pagination.items
-    _prev = None if not pagination.has_prev else url_for('api.get_posts', page=page - 1, _external=True)
-    _next = None if not pagination.has_next else url_for('api.get_posts', page=page + 1, _external=True)
-
-    return jsonify({'posts': [post.json for post in posts], 'prev': _prev, 'next': _next, 'count': pagination.total})
+    page = paginate(user.timeline.order_by(TimelineEntry.timestamp.desc(), TimelineEntry.post_id.desc()),
+                    'api.get_user_followed_posts', (TimelineEntry.timestamp, TimelineEntry.post_id), user_id=user_id)
+    view = Representation(Post, page.items)
+    response = not_modified(page.etag(view.version))
+    if response is not None:
+        return response
+    return jsonify({'posts': view.json(), 'prev': page.prev, 'next': page.next, 'count': page.count})
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import hashlib
+
+from flask import after_this_request, current_app, request
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    """Return an empty 304 response if the request's `If-None-Match` or `If-Modified-Since` still matches.
+
+    Otherwise return None and tag the view's eventual 200 response with the validators, so callers check before they
+    serialize or render anything.  `If-Modified-Since` is ignored when the request carries `If-None-Match`.
+    """
+    if request.if_none_match:
+        matches = request.if_none_match.contains_weak(etag)
+    else:
+        matches = bool(last_modified and request.if_modified_since and
+                       last_modified.replace(microsecond=0) <= request.if_modified_since)
+    if matches:
+        return _set_validators(current_app.response_class(status=304), etag, last_modified)
+
+    @after_this_request
+    def add_validators(response):
+        if response.status_code == 200:
+            _set_validators(response, etag, last_modified)
+        return response
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
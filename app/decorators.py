@@ -3,9 +3,11 @@
 
 from functools import wraps
 
-from flask import abort
+from flask import abort, current_app, request
 from flask.ext.login import current_user
+from flask.ext.sqlalchemy import get_debug_queries
 
+from .exceptions import QueryBudgetExceeded
 from .models import Permission
 
 
@@ -24,3 +26,28 @@ def permission_required(permission):
 
 def admin_required(func):
     return permission_required(Permission.ADMIN)(func)
+
+
+def query_budget(max_queries):
+    """Flag views that run more than `max_queries` queries.
+
+    Counting relies on Flask-SQLAlchemy's query recording (on in debug and testing).  Overruns are logged, or raised
+    when `FLASKY_QUERY_BUDGET_STRICT` is set so the test suite catches N+1 regressions.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            before = len(get_debug_queries())
+            response = func(*args, **kwargs)
+            used = len(get_debug_queries()) - before
+            if used > max_queries:
+                message = '%s ran %d queries, over its budget of %d' % (request.endpoint, used, max_queries)
+                if current_app.config['FLASKY_QUERY_BUDGET_STRICT']:
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,17 +1,128 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from threading import Thread
+import atexit
+import smtplib
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import sleep
 
 from flask import render_template, current_app
 from flask.ext.mail import Message
 
 from . import mail
 
+_STOP = object()
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+
+class MailPool(object):
+    """Bounded pool of mail workers fed by a queue.
+
+    Each worker opens one SMTP connection per batch and sends up to `FLASKY_MAIL_BATCH_SIZE` queued messages over it.
+    A full queue blocks the sender for up to `FLASKY_MAIL_QUEUE_TIMEOUT` seconds, then the message is sent inline.  A
+    failed batch is retried on a new connection with exponential backoff, up to `FLASKY_MAIL_RETRIES` times; a message
+    that fails for any other reason, a bad header say, is logged and skipped.  A worker that dies anyway is replaced on
+    the next submit.
+    :meth:`shutdown`, also run at exit, lets the workers drain the queue.  With `FLASKY_MAIL_WORKERS` set to 0 every
+    message is sent inline.
+    """
+
+    def __init__(self, app=None):
+        self.queue = None
+        self.workers = []
+        self.lock = Lock()
+        self.registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self.registered:
+            atexit.register(self.shutdown)
+            self.registered = True
+
+    def submit(self, msg):
+        app = current_app._get_current_object()
+        if not app.config['FLASKY_MAIL_WORKERS']:
+            mail.send(msg)
+            return
+        self._start(app.config)
+        try:
+            self.queue.put((app, msg), timeout=app.config['FLASKY_MAIL_QUEUE_TIMEOUT'])
+        except Full:
+            app.logger.warning('Mail queue is full, sending inline')
+            mail.send(msg)
+
+    def shutdown(self, timeout=None):
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for _ in workers:
+            self.queue.put(_STOP)
+        for worker in workers:
+            worker.join(timeout)
+
+    def _start(self, config):
+        with self.lock:
+            alive = [worker for worker in self.workers if worker.is_alive()]
+            if alive and len(alive) == len(self.workers):
+                return
+            if not self.workers:
+                self.queue = Queue(config['FLASKY_MAIL_QUEUE_SIZE'])
+            started = [Thread(target=self._work, args=(self.queue,), name='mail-%d' % i, daemon=True)
+                       for i in range(len(alive), config['FLASKY_MAIL_WORKERS'])]
+            self.workers = alive + started
+            for worker in started:
+                worker.start()
+
+    def _work(self, queue):
+        carry = None
+        while True:
+            item, carry = carry or queue.get(), None
+            if item is _STOP:
+                return
+            app, batch = item[0], [item[1]]
+            while len(batch) < app.config['FLASKY_MAIL_BATCH_SIZE']:
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    break
+                if item is _STOP or item[0] is not app:
+                    carry = item
+                    break
+                batch.append(item[1])
+            try:
+                self._deliver(app, batch)
+            except Exception:
+                app.logger.exception('Dropping %d messages', len(batch))
+
+    @staticmethod
+    def _deliver(app, batch):
+        retries = app.config['FLASKY_MAIL_RETRIES']
+        with app.app_context():
+            for attempt in range(retries + 1):
+                try:
+                    with mail.connect() as connection:
+                        while batch:
+                            _send(app, connection, batch[0])
+                            batch.pop(0)
+                    return
+                except (smtplib.SMTPException, OSError):
+                    if attempt == retries:
+                        app.logger.exception('Dropping %d messages after %d attempts', len(batch), attempt + 1)
+                    else:
+                        sleep(app.config['FLASKY_MAIL_RETRY_DELAY'] * 2 ** attempt)
+
+
+def _send(app, connection, msg):
+    """Send `msg` over `connection`, logging rather than raising any error that is not the connection's."""
+    try:
+        connection.send(msg)
+    except (smtplib.SMTPException, OSError):
+        raise
+    except Exception:
+        app.logger.exception('Skipping a message to %s that cannot be sent', ', '.join(msg.recipients or ()))
+
+
+mail_pool = MailPool()
 
 
 def send_email(to, subject, template, **context):
@@ -20,6 +131,5 @@ def send_email(to, subject, template, **context):
                   sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
     msg.body = render_template('%s.txt' % template, **context)
     msg.html = render_template('%s.html' % template, **context)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    mail_pool.submit(msg)
+    return msg
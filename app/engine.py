@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import random
+from functools import partial
+from time import time
+
+from flask import current_app, has_request_context, request, session
+from flask.ext.sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+SAFE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+WROTE_KEY = 'flasky.db_wrote'
+REPLICA_KEY = 'flasky.db_replica'
+
+
+class RoutingSession(SignallingSession):
+    """Sends the SELECTs of safe requests to the `FLASKY_DB_REPLICAS` binds, and everything else to the primary.
+
+    Only requests to `FLASKY_DB_REPLICA_BLUEPRINTS` read from a replica.  Writes, reads in a transaction that has
+    flushed, reads outside a request, and models with a bind of their own keep their usual engine.  A client whose
+    request wrote, whatever its method, reads from the primary for the next `FLASKY_DB_PIN_SECONDS`, so it sees its own
+    writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            _mark_request_wrote()
+        replicas = self.app.config['FLASKY_DB_REPLICAS']
+        if (replicas and isinstance(clause, Select) and not self._flushing and not self.info.get('wrote') and
+                (mapper is None or mapper.mapped_table.info.get('bind_key') is None) and _reads_from_replica()):
+            return get_state(self.app).db.get_engine(self.app, bind=random.choice(replicas))
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    @staticmethod
+    def on_flushed(session, flush_context):
+        session.info['wrote'] = True
+        _mark_request_wrote()
+
+    @staticmethod
+    def on_finished(session):
+        session.info.pop('wrote', None)
+
+
+event.listen(RoutingSession, 'after_flush', RoutingSession.on_flushed)
+event.listen(RoutingSession, 'after_commit', RoutingSession.on_finished)
+event.listen(RoutingSession, 'after_rollback', RoutingSession.on_finished)
+
+
+def _reads_from_replica():
+    return has_request_context() and request.environ.get(REPLICA_KEY, False)
+
+
+def route_reads():
+    """Let this request read from a replica, if it qualifies.
+
+    Set per dispatched request, so code running under a bare `test_request_context`, as manage.py commands do, keeps
+    reading from the primary.
+    """
+    request.environ[REPLICA_KEY] = (request.method in SAFE_METHODS and
+                                    request.blueprint in current_app.config['FLASKY_DB_REPLICA_BLUEPRINTS'] and
+                                    session.get('primary_until', 0) < time())
+
+
+def _mark_request_wrote():
+    if has_request_context():
+        request.environ[WROTE_KEY] = True
+
+
+def pin_to_primary(response):
+    """After a request that wrote, route the client's reads to the primary for `FLASKY_DB_PIN_SECONDS`.
+
+    Writes still pending in the session count too: they are committed on teardown, after this runs.
+    """
+    if not current_app.config['FLASKY_DB_REPLICAS']:
+        return response
+    db_session = get_state(current_app).db.session
+    if request.environ.get(WROTE_KEY) or db_session.new or db_session.dirty or db_session.deleted:
+        session['primary_until'] = time() + current_app.config['FLASKY_DB_PIN_SECONDS']
+    return response
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """Flask-SQLAlchemy with a :class:`RoutingSession`, and `SQLALCHEMY_POOL_SIZE` honoured for SQLite files too.
+
+    Flask-SQLAlchemy leaves file databases on a connection per checkout.  Given a pool size they get a `QueuePool`
+    instead, whose connections keep their page cache and mmap across requests and may be checked out by any thread.
+    """
+
+    def init_app(self, app):
+        super(SQLAlchemy, self).init_app(app)
+        app.before_request(route_reads)
+        app.after_request(pin_to_primary)
+
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        super(SQLAlchemy, self).apply_driver_hacks(app, info, options)
+        if info.drivername == 'sqlite' and info.database not in (None, '', ':memory:') and options.get('pool_size'):
+            options['poolclass'] = QueuePool
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+
+
+def pragma_statements(pragmas):
+    """`PRAGMA` statements for a `FLASKY_SQLITE_PRAGMAS` mapping, `busy_timeout` first so the rest wait on locks."""
+    names = sorted(pragmas, key=lambda name: (name != 'busy_timeout', name))
+    return ['PRAGMA %s = %s' % (name, pragmas[name]) for name in names]
+
+
+def apply_pragmas(statements, dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+class EngineTuning(object):
+    """Runs `FLASKY_SQLITE_PRAGMAS` on each new connection of the app's SQLite engines, including `SQLALCHEMY_BINDS`.
+
+    Server databases are tuned with Flask-SQLAlchemy's own `SQLALCHEMY_POOL_SIZE` and `SQLALCHEMY_POOL_RECYCLE`.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        statements = pragma_statements(app.config['FLASKY_SQLITE_PRAGMAS'])
+        for bind in [None] + sorted(app.config['SQLALCHEMY_BINDS'] or ()):
+            engine = self.db.get_engine(app, bind)
+            if engine.dialect.name == 'sqlite' and statements:
+                event.listen(engine, 'connect', partial(apply_pragmas, statements))
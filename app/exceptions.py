@@ -3,3 +3,7 @@
 
 class ValidationError(ValueError):
     pass
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+from datetime import datetime
+
+from . import db
+from .exceptions import ValidationError
+from .models import Comment, Post
+
+EXPORTS = {
+    'posts': (Post, ('id', 'timestamp', 'author_id', 'comment_count', 'body', 'body_html')),
+    'comments': (Comment, ('id', 'timestamp', 'post_id', 'author_id', 'disabled', 'body', 'body_html')),
+}
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def parse_since(since):
+    """Turn `since` into an `int` id or a `(datetime, id)` pair; None and '' mean everything.
+
+    A timestamp may be followed by `,<id>`, the last row already exported; without one the id is None.
+    """
+    if not since:
+        return None
+    if since.isdigit():
+        return int(since)
+    timestamp, _, last_id = since.partition(',')
+    if not last_id.isdigit() and last_id:
+        raise ValidationError('since must be an id or an ISO 8601 timestamp, optionally followed by ,<id>')
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(timestamp, timestamp_format), int(last_id) if last_id else None
+        except ValueError:
+            pass
+    raise ValidationError('since must be an id or an ISO 8601 timestamp, optionally followed by ,<id>')
+
+
+def export_ndjson(name, since=None, chunk_size=1000):
+    """Return an iterator over the rows of export `name` as newline-delimited json, one line per row.
+
+    `since` is an id, exporting rows with a greater id in id order, or a timestamp, exporting rows from that timestamp
+    on in timestamp then id order.  Rows tied on a bare timestamp are exported again, so `<timestamp>,<id>` of the last
+    row exported resumes exactly after it.  Rows are plain column tuples streamed `chunk_size` at a time, so memory
+    stays flat for any table size.  Each line carries the id and timestamp needed for the next incremental `since`.
+    """
+    model, names = EXPORTS[name]
+    columns = [getattr(model, column) for column in names]
+    query = db.session.query(*columns)
+    since = parse_since(since)
+    if isinstance(since, tuple):
+        timestamp, last_id = since
+        if last_id is None:
+            query = query.filter(model.timestamp >= timestamp)
+        else:
+            query = query.filter(db.or_(model.timestamp > timestamp,
+                                        db.and_(model.timestamp == timestamp, model.id > last_id)))
+        query = query.order_by(model.timestamp.asc(), model.id.asc())
+    else:
+        query = query.filter(model.id > (since or 0)).order_by(model.id.asc())
+
+    return (json.dumps(dict(zip(names, row)), default=_isoformat, sort_keys=True) + '\n'
+            for row in query.yield_per(chunk_size))
+
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
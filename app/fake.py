@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import hashlib
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from werkzeug.security import generate_password_hash
+
+from . import db
+from .models import Role, User, Follow, Post, Comment, TimelineEntry
+from .rendering import render_batch
+from .search import indexes
+
+
+class PowerLaw(object):
+    """Draw items so that the item of popularity rank `r` is picked with weight `1 / (r + 1) ** skew`."""
+
+    def __init__(self, rng, items, skew):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cumulative = list(accumulate(1.0 / (rank + 1) ** skew for rank in range(len(self.items))))
+
+    def __call__(self):
+        return self.items[bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+class FakeDataGenerator(object):
+    """Deterministic, seedable bulk generator of users, follows, posts and comments for load testing.
+
+    Rows go in through batched Core inserts with explicit ids.  Every user shares one precomputed password hash and
+    bodies are drawn from a fixed pool rendered once, so the cost per row is a tuple build.  Post authorship and the
+    follower graph follow a power law with exponent `skew`.  The ORM events are bypassed, so the counters, timelines
+    and search indexes are rebuilt at the end.
+    """
+
+    def __init__(self, users=100, posts=1000, comments=2000, follows=20, skew=1.2, seed=0, batch_size=10000,
+                 body_pool=500, now=None):
+        self.counts = {'users': users, 'posts': posts, 'comments': comments}
+        self.follows = follows
+        self.skew = skew
+        self.seed = seed
+        self.batch_size = batch_size
+        self.body_pool = body_pool
+        self.rng = random.Random(seed)
+        # timestamps count back from `now`, so runs match only when it is pinned
+        self.now = now or datetime.utcnow()
+
+    def run(self):
+        import forgery_py as forgery
+
+        # forgery_py draws from the global generator
+        random.seed(self.seed)
+        post_bodies = self._bodies(lambda: forgery.lorem_ipsum.sentences(quantity=self.rng.randint(1, 5)),
+                                   Post.ALLOWED_TAGS)
+        comment_bodies = self._bodies(lambda: forgery.lorem_ipsum.sentences(quantity=self.rng.randint(1, 3)),
+                                      Comment.ALLOWED_TAGS)
+
+        user_ids = self._insert(User, self._users(forgery))
+        authors = PowerLaw(self.rng, user_ids, self.skew)
+        self._insert(Follow, self._follows(user_ids, PowerLaw(self.rng, user_ids, self.skew)))
+        post_ids = self._insert(Post, self._posts(authors, post_bodies))
+        self._insert(Comment, self._comments(authors, PowerLaw(self.rng, post_ids, self.skew), comment_bodies))
+
+        User.rebuild_counters(chunk_size=self.batch_size)
+        Post.rebuild_counters(chunk_size=self.batch_size)
+        TimelineEntry.backfill(chunk_size=max(self.batch_size // max(self.follows, 1), 1))
+        for index in indexes.values():
+            index.rebuild()
+
+    def _bodies(self, make, allowed_tags):
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import cpu_count
+
+        bodies = [(i, make(), None) for i in range(self.body_pool)]
+        workers = cpu_count()
+        with ProcessPoolExecutor(workers) as pool:
+            rendered = dict(html for batch in pool.map(render_batch, [allowed_tags] * workers, [
+                bodies[i::workers] for i in range(workers)]) for html in batch)
+        return [(body, rendered[i]) for i, body, _ in bodies]
+
+    def _past(self, days=365):
+        return self.now - timedelta(seconds=self.rng.randrange(days * 24 * 60 * 60))
+
+    def _next_id(self, model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+    @staticmethod
+    def _first_names():
+        from forgery_py.dictionaries_loader import get_dictionary
+
+        # forgery_py's first_name() appends to its cached dictionary on every call, so draw from a stable copy
+        return sorted({name.strip() for kind in ('male_first_names', 'female_first_names')
+                       for name in get_dictionary(kind)})
+
+    def _users(self, forgery):
+        role_id = Role.query.filter_by(default=True).first().id
+        password_hash = generate_password_hash('secret')
+        first_names = self._first_names()
+        first_id = self._next_id(User)
+        for user_id in range(first_id, first_id + self.counts['users']):
+            username = '%s%d' % (self.rng.choice(first_names).lower(), user_id)
+            email = '%s@example.com' % username
+            name = '%s %s' % (self.rng.choice(first_names), forgery.name.last_name())
+            yield {'id': user_id, 'email': email, 'username': username, 'role_id': role_id,
+                   'password_hash': password_hash, 'confirmed': True, 'name': name,
+                   'location': forgery.address.city(), 'about_me': forgery.lorem_ipsum.sentence(),
+                   'member_since': self._past(3 * 365), 'last_seen': self._past(30),
+                   'avatar_hash': hashlib.md5(email.encode('utf-8')).hexdigest()}
+
+    def _follows(self, user_ids, popular):
+        for follower_id in user_ids:
+            followed = {follower_id}
+            for _ in range(min(self.rng.randint(0, 2 * self.follows), len(user_ids) - 1)):
+                followed.add(popular())
+            for followed_id in sorted(followed):
+                yield {'follower_id': follower_id, 'followed_id': followed_id, 'timestamp': self._past()}
+
+    def _posts(self, authors, bodies):
+        first_id = self._next_id(Post)
+        for post_id in range(first_id, first_id + self.counts['posts']):
+            body, body_html = self.rng.choice(bodies)
+            yield {'id': post_id, 'body': body, 'body_html': body_html, 'timestamp': self._past(),
+                   'author_id': authors()}
+
+    def _comments(self, authors, posts, bodies):
+        first_id = self._next_id(Comment)
+        for comment_id in range(first_id, first_id + self.counts['comments']):
+            body, body_html = self.rng.choice(bodies)
+            yield {'id': comment_id, 'body': body, 'body_html': body_html, 'timestamp': self._past(),
+                   'disabled': self.rng.random() < .1, 'author_id': authors(), 'post_id': posts()}
+
+    def _insert(self, model, rows):
+        """Insert `rows` in batches and return the ids written."""
+        table = model.__table__
+        ids, batch, total = [], [], 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                total += self._flush(table, batch, ids)
+                batch = []
+        total += self._flush(table, batch, ids)
+        print('%s %s inserted.' % (total, table.name))
+        return ids
+
+    @staticmethod
+    def _flush(table, batch, ids):
+        if batch:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            ids.extend(row['id'] for row in batch if 'id' in row)
+        return len(batch)
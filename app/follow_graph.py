@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from threading import RLock, Thread
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import object_session
+
+_EMPTY = array('l')
+
+
+class FollowGraph(object):
+    """In-process copy of the `follows` table as sorted id arrays per user, in both directions.
+
+    Membership tests are a binary search.  The copy loads before the app's first request, or on first use after a
+    reset, and takes `Follow` inserts and deletes from this process once their transaction commits.  Once it is
+    `FLASKY_FOLLOW_GRAPH_TTL` seconds old, a background thread reloads it while readers keep the old copy, so changes
+    made by other worker processes, and bulk statements on `follows`, show up to that many seconds late.  Arrays are
+    replaced, never mutated, so readers need no lock.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.lock = RLock()
+        self.ttl = None
+        self.graph = None
+        self.loaded_at = 0
+        self.refresher = None
+        self.replayed = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['FLASKY_FOLLOW_GRAPH_TTL']
+        app.before_first_request(self._load)
+
+    def is_following(self, follower_id, followed_id):
+        return _contains(self._load()[0].get(follower_id, _EMPTY), followed_id)
+
+    def is_mutual(self, user_id, other_id):
+        return self.is_following(user_id, other_id) and self.is_following(other_id, user_id)
+
+    def followed_count(self, user_id):
+        return len(self._load()[0].get(user_id, _EMPTY))
+
+    def follower_count(self, user_id):
+        return len(self._load()[1].get(user_id, _EMPTY))
+
+    def reset(self, *_, **__):
+        with self.lock:
+            self.graph = None
+
+    def _load(self):
+        """Return `(followed, followers)`, dicts of user id to a sorted array of user ids."""
+        graph = self.graph
+        if graph is None:
+            with self.lock:
+                if self.graph is None:
+                    self.graph, self.loaded_at = self._read(), monotonic()
+                return self.graph
+        if self.ttl and monotonic() >= self.loaded_at + self.ttl:
+            self._refresh_in_background(current_app._get_current_object())
+        return graph
+
+    def _read(self):
+        # a connection of its own reads committed rows only
+        table = self.db.metadata.tables['follows']
+        rows = self.db.engine.execute(select([table.c.follower_id, table.c.followed_id]))
+        followed, followers = defaultdict(list), defaultdict(list)
+        for follower_id, followed_id in rows:
+            followed[follower_id].append(followed_id)
+            followers[followed_id].append(follower_id)
+        return tuple({user_id: array('l', sorted(ids)) for user_id, ids in index.items()}
+                     for index in (followed, followers))
+
+    def _refresh_in_background(self, app):
+        with self.lock:
+            if self.replayed is not None:
+                return
+            # changes committed while the reload reads are replayed onto its result
+            self.replayed = []
+            self.refresher = Thread(target=self._refresh, args=(app,), name='follow-graph-refresh', daemon=True)
+            self.refresher.start()
+
+    def _refresh(self, app):
+        graph = None
+        try:
+            with app.app_context():
+                graph = self._read()
+        except Exception:
+            app.logger.exception('Reloading the follow graph failed')
+        with self.lock:
+            changes, self.replayed = self.replayed, None
+            self.loaded_at = monotonic()
+            if graph is not None and self.graph is not None:
+                self.graph = graph
+                for change in changes:
+                    self._apply(*change)
+
+    def _apply(self, added, follower_id, followed_id):
+        with self.lock:
+            if self.replayed is not None:
+                self.replayed.append((added, follower_id, followed_id))
+            if self.graph is None:
+                return
+            followed, followers = self.graph
+            for index, key, value in ((followed, follower_id, followed_id), (followers, followed_id, follower_id)):
+                ids = index.get(key, _EMPTY)
+                if _contains(ids, value) != added:
+                    position = bisect_left(ids, value)
+                    tail = ids[position + (0 if added else 1):]
+                    index[key] = ids[:position] + (array('l', [value]) if added else _EMPTY) + tail
+
+    # Event handlers: changes queue on the session and apply once it commits.
+
+    def on_inserted(self, mapper, connection, target):
+        self._queue(target, True)
+
+    def on_deleted(self, mapper, connection, target):
+        self._queue(target, False)
+
+    @staticmethod
+    def _queue(target, added):
+        object_session(target).info.setdefault('follow_changes', []).append(
+            (added, target.follower_id, target.followed_id))
+
+    def on_commit(self, session):
+        for change in session.info.pop('follow_changes', ()):
+            self._apply(*change)
+
+    @staticmethod
+    def on_rollback(session, *_):
+        session.info.pop('follow_changes', None)
+
+
+def _contains(ids, value):
+    position = bisect_left(ids, value)
+    return position < len(ids) and ids[position] == value
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from flask import request
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from .cache import LRUCache
+
+
+class FragmentCacheExtension(Extension):
+    """Adds ``{% cache key, version %}...{% endcache %}`` to templates.
+
+    The body renders once per `key` and request scheme and is served from the app's :class:`FragmentCache` while
+    `version` compares equal.  Keys are tuples laid out as ``(kind, id, author_id, ...)``, e.g.
+    ``('post', post.id, post.author_id, viewer)``, so the model events can find them.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        parser.stream.expect('comma')
+        version = parser.parse_expression()
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [key, version]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, version, caller):
+        return self.environment.fragment_cache.render((key, request.scheme), version, caller)
+
+
+class FragmentCache(object):
+    """LRU store of rendered template fragments, filled through the ``{% cache %}`` tag.
+
+    Entries keep the version they were rendered at, so a fragment whose rows changed elsewhere, e.g. in another
+    process, is re-rendered rather than served stale.  :meth:`invalidate` and :meth:`invalidate_author` free entries
+    early when a row changes locally.
+    """
+
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache.resize(app.config['FLASKY_FRAGMENT_CACHE_SIZE'])
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.extend(fragment_cache=self)
+
+    def render(self, key, version, render):
+        hit = self.cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        html = render()
+        self.cache.set(key, (version, html))
+        return html
+
+    def invalidate(self, kind, id_):
+        self._drop(lambda key: key[:2] == (kind, id_))
+
+    def invalidate_author(self, author_id):
+        self._drop(lambda key: key[2] == author_id)
+
+    def _drop(self, match):
+        for key in self.cache.keys():
+            if match(key[0]):
+                self.cache.pop(key)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import heapq
+from datetime import datetime
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+from flask import current_app, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+
+ENVIRON_KEY = 'flasky.timing'
+
+
+class RequestTiming(object):
+    """Where one request's time went, in seconds."""
+
+    def __init__(self):
+        self.started = monotonic()
+        self.timestamp = datetime.utcnow()
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+        self.rendering = 0
+        self.total = None
+        self.method = self.path = self.endpoint = self.status = None
+
+    def server_timing(self):
+        return 'db;dur=%.1f;desc="%d queries", render;dur=%.1f, total;dur=%.1f' % (
+            self.query_time * 1000, self.queries, self.render_time * 1000, self.total * 1000)
+
+
+def current_timing():
+    return request.environ.get(ENVIRON_KEY) if has_request_context() else None
+
+
+class TimedTemplate(Template):
+    """Adds the time spent in top-level renders to the current request's timing."""
+
+    def render(self, *args, **kwargs):
+        timing = current_timing()
+        if timing is None:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        timing.rendering += 1
+        started = monotonic()
+        try:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            timing.rendering -= 1
+            if not timing.rendering:
+                timing.render_time += monotonic() - started
+
+
+class Instrumentation(object):
+    """Opt-in per-request counts and timings of SQL, template rendering and the whole request.
+
+    With `FLASKY_INSTRUMENTATION` set, every response carries them as a `Server-Timing` header, and the slowest
+    `FLASKY_SLOW_REQUESTS` requests over `FLASKY_SLOW_REQUEST_MS` are kept, in a min-heap on `total`, for the admin
+    page.  With `SQLALCHEMY_COMMIT_ON_TEARDOWN` the session is committed before the timing ends, so the flush's
+    queries count; the COMMIT itself is in `total` only.  Time spent streaming a response body after the view returns
+    is not counted.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.lock = Lock()
+        self.slow_requests = []
+        self.limit = 0
+        self.sequence = count()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['FLASKY_INSTRUMENTATION']:
+            return
+        self.resize(app.config['FLASKY_SLOW_REQUESTS'])
+        app.jinja_env.template_class = TimedTemplate
+        for bind in [None] + sorted(app.config['SQLALCHEMY_BINDS'] or ()):
+            engine = self.db.get_engine(app, bind)
+            event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+        # first, so the timing covers the other hooks, such as the user load
+        app.before_request_funcs.setdefault(None, []).insert(0, self.start)
+        app.after_request(self.finish)
+
+    def resize(self, limit):
+        with self.lock:
+            self.limit = limit
+            while len(self.slow_requests) > limit:
+                heapq.heappop(self.slow_requests)
+
+    def slowest(self):
+        with self.lock:
+            return [timing for _, _, timing in sorted(self.slow_requests, reverse=True)]
+
+    @staticmethod
+    def start():
+        request.environ[ENVIRON_KEY] = RequestTiming()
+
+    def finish(self, response):
+        timing = current_timing()
+        if timing is None:
+            return response
+        if current_app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN']:
+            self.db.session.commit()
+        timing.total = monotonic() - timing.started
+        timing.method, timing.path, timing.endpoint = request.method, request.full_path, request.endpoint
+        timing.status = response.status_code
+        response.headers['Server-Timing'] = timing.server_timing()
+        if timing.total * 1000 >= current_app.config['FLASKY_SLOW_REQUEST_MS']:
+            with self.lock:
+                if len(self.slow_requests) < self.limit:
+                    heapq.heappush(self.slow_requests, (timing.total, next(self.sequence), timing))
+                elif self.slow_requests and timing.total > self.slow_requests[0][0]:
+                    heapq.heapreplace(self.slow_requests, (timing.total, next(self.sequence), timing))
+        return response
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_timing() is not None:
+            conn.info.setdefault('flasky_query_started', []).append(monotonic())
+
+    @staticmethod
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timing = current_timing()
+        if timing is not None and conn.info.get('flasky_query_started'):
+            timing.queries += 1
+            timing.query_time += monotonic() - conn.info['flasky_query_started'].pop()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import atexit
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from weakref import WeakKeyDictionary
+
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class LastSeenBuffer(object):
+    """Write-behind buffer for `User.last_seen`.
+
+    :meth:`touch` records the time in memory, at most once per `FLASKY_LAST_SEEN_RESOLUTION` seconds per user, and a
+    background thread writes the pending times every `FLASKY_LAST_SEEN_FLUSH_INTERVAL` seconds as one batched UPDATE.
+    :meth:`stop`, also run at interpreter exit, ends the thread and writes whatever is still pending.  Pending times
+    are held per app, weakly, so they never keep an app alive.  An interval of 0 writes through the session instead.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self.pending = WeakKeyDictionary()
+        self.lock = Lock()
+        self.thread = None
+        self.stopping = None
+        self.registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self.registered:
+            atexit.register(self.stop)
+            self.registered = True
+
+    def touch(self, user, now=None):
+        app = current_app._get_current_object()
+        now = now or datetime.utcnow()
+        if user.last_seen is not None and now - user.last_seen < timedelta(
+                seconds=app.config['FLASKY_LAST_SEEN_RESOLUTION']):
+            return
+        if not app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL']:
+            user.last_seen = now
+            self.db.session.add(user)
+            return
+
+        with self.lock:
+            self.pending.setdefault(app, {})[user.id] = now
+            if self.thread is None:
+                self.stopping = Event()
+                self.thread = Thread(target=self._run, args=(app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL'],
+                                                             self.stopping), name='last-seen-flush', daemon=True)
+                self.thread.start()
+        # the request sees the new time without dirtying the session
+        set_committed_value(user, 'last_seen', now)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, WeakKeyDictionary()
+        for app, seen in list(pending.items()):
+            table = self.db.metadata.tables['users']
+            statement = table.update().where(table.c.id == bindparam('_id')).values(last_seen=bindparam('_last_seen'))
+            try:
+                self.db.get_engine(app).execute(statement, [{'_id': user_id, '_last_seen': last_seen}
+                                                            for user_id, last_seen in seen.items()])
+            except Exception:
+                app.logger.exception('Writing last_seen for %d users failed', len(seen))
+                with self.lock:
+                    retry = self.pending.setdefault(app, {})
+                    for user_id, last_seen in seen.items():
+                        retry.setdefault(user_id, last_seen)
+
+    def stop(self, timeout=None):
+        with self.lock:
+            thread, stopping, self.thread = self.thread, self.stopping, None
+        if thread is not None:
+            stopping.set()
+            thread.join(timeout)
+        self.flush()
+
+    def _run(self, interval, stopping):
+        while not stopping.wait(interval):
+            self.flush()
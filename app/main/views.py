@@ -6,9 +6,10 @@ from flask.ext.login import login_required, current_user
 
 from . import main
 from .forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm
-from .. import db
-from ..decorators import admin_required, permission_required
-from ..models import User, Permission, Role, Post, Comment
+from .. import db, instrumentation
+from ..decorators import admin_required, permission_required, query_budget
+from ..models import User, Permission, Role, Post, Comment, TimelineEntry, preload
+from ..search import indexes
 
 
 @main.app_context_processor
@@ -17,6 +18,7 @@ def inject_permissions():
 
 
 @main.route('/', methods=['GET', 'POST'])
+@query_budget(6)
 def index():
     form = PostForm()
     if current_user.can(Permission.WRITE_ARTICLES) and form.validate_on_submit():
@@ -28,25 +30,47 @@ def index():
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
 
     show_followed_cookie = bool(request.cookies.get('show_followed', '')) if current_user.is_authenticated else False
-    query = current_user.followed_posts if show_followed_cookie else Post.query
+    if show_followed_cookie:
+        query = current_user.timeline.order_by(TimelineEntry.timestamp.desc(), TimelineEntry.post_id.desc())
+    else:
+        query = Post.query.order_by(Post.timestamp.desc())
 
-    pagination = query.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=False)
-    posts = pagination.items
+    pagination = query.paginate(page, per_page, error_out=False)
+    posts = preload(pagination.items, 'author')
     name = 'Stranger' if not current_user.is_authenticated else (current_user.name or current_user.username)
     return render_template('index.html', form=form, posts=posts, name=name, pagination=pagination,
                            show_followed=show_followed_cookie)
 
 
+@main.route('/search')
+@query_budget(6)
+def search():
+    q = request.args.get('q', '')
+    type_ = request.args.get('type', 'posts')
+    if type_ not in indexes:
+        abort(404)
+    query = indexes[type_].search(q)
+    if type_ == 'comments':
+        query = query.filter(Comment.disabled.isnot(True))
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE' if type_ == 'posts' else 'FLASKY_COMMENTS_PER_PAGE']
+    pagination = query.paginate(page, per_page, error_out=False)
+    results = preload(pagination.items, 'author')
+    return render_template('search.html', q=q, type=type_, results=results, pagination=pagination)
+
+
 @main.route('/user/<username>')
+@query_budget(8)
 def user_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
 
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
     pagination = user.posts.order_by(Post.timestamp.desc()).paginate(page, per_page, error_out=False)
-    posts = pagination.items
+    posts = preload(pagination.items, 'author')
+    status = current_user.following_status([user])[user.id]
 
-    return render_template('user_profile.html', user=user, posts=posts, pagination=pagination)
+    return render_template('user_profile.html', user=user, posts=posts, pagination=pagination, status=status)
 
 
 @main.route('/edit-profile', methods=['GET', 'POST'])
@@ -94,6 +118,7 @@ def edit_profile_admin(user_id):
 
 
 @main.route('/post/<int:post_id>', methods=['GET', 'POST'])
+@query_budget(7)
 def show_post(post_id):
     post = Post.query.get_or_404(post_id)
     form = CommentForm()
@@ -106,10 +131,11 @@ def show_post(post_id):
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
     page = request.args.get('page', 1, type=int)
     if page == -1:
-        page = (post.comments.count() - 1) / per_page + 1
+        page = (post.comment_count - 1) // per_page + 1
 
     pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(page, per_page, error_out=False)
-    comments = pagination.items
+    comments = preload(pagination.items, 'author')
+    preload([post], 'author')
 
     return render_template('post.html', posts=[post], form=form, comments=comments, pagination=pagination)
 
@@ -138,7 +164,7 @@ def follow(username):
     if not user:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    if current_user.is_following(user):
+    if current_user.follow_for(user) is not None:
         flash('You are already following this user.')
         return redirect(url_for('.user_profile', username=username))
     current_user.follow(user)
@@ -154,7 +180,7 @@ def unfollow(username):
     if not user:
         flash('Invalid user.')
         return redirect(url_for('.index'))
-    if not current_user.is_following(user):
+    if current_user.follow_for(user) is None:
         flash('You are not following this user.')
         return redirect(url_for('.user_profile', username=username))
     current_user.unfollow(user)
@@ -163,6 +189,7 @@ def unfollow(username):
 
 
 @main.route('/followers/<username>')
+@query_budget(6)
 def followers(username):
     user = User.query.filter_by(username=username).first()
     if not user:
@@ -172,11 +199,13 @@ def followers(username):
     per_page = current_app.config['FLASKY_FOLLOWERS_PER_PAGE']
     pagination = user.follower.paginate(page, per_page, error_out=False)
     follows = [{'user': item.follower, 'timestamp': item.timestamp} for item in pagination.items]
+    status = current_user.following_status([follow['user'] for follow in follows])
     return render_template('follower.html', user=user, title='Followers of', endpoint='.followers',
-                           pagination=pagination, follows=follows)
+                           pagination=pagination, follows=follows, status=status)
 
 
 @main.route('/followed-by/<username>')
+@query_budget(6)
 def followed_by(username):
     user = User.query.filter_by(username=username).first()
     if not user:
@@ -186,8 +215,9 @@ def followed_by(username):
     per_page = current_app.config['FLASKY_FOLLOWERS_PER_PAGE']
     pagination = user.followed.paginate(page, per_page, error_out=False)
     follows = [{'user': item.followed, 'timestamp': item.timestamp} for item in pagination.items]
-    return render_template('follower.html', user=user, title='Followed by', endpoint='.followers',
-                           pagination=pagination, follows=follows)
+    status = current_user.following_status([follow['user'] for follow in follows])
+    return render_template('follower.html', user=user, title='Followed by', endpoint='.followed_by',
+                           pagination=pagination, follows=follows, status=status)
 
 
 @main.route('/all')
@@ -207,11 +237,12 @@ def show_followed():
 @main.route('/moderate')
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
+@query_budget(6)
 def moderate():
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['FLASKY_COMMENTS_PER_PAGE']
     pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page, per_page, error_out=False)
-    comments = pagination.items
+    comments = preload(pagination.items, 'author', 'post')
     return render_template('moderate.html', comments=comments, pagination=pagination, page=page)
 
 
@@ -235,3 +266,11 @@ def moderate_disable(comment_id):
     db.session.add(comment)
     page = request.args.get('page', 1, type=int)
     return redirect(url_for('.moderate', page=page))
+
+
+@main.route('/slow-requests')
+@login_required
+@admin_required
+def slow_requests():
+    return render_template('slow_requests.html', enabled=current_app.config['FLASKY_INSTRUMENTATION'],
+                           timings=instrumentation.slowest(), threshold=current_app.config['FLASKY_SLOW_REQUEST_MS'])
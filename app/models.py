@@ -2,18 +2,23 @@
 # coding=utf-8
 
 import hashlib
+from collections import namedtuple
 from datetime import datetime
 from random import randint
+from time import monotonic
 
-import bleach
-from flask import current_app, request, url_for
+from flask import current_app, request
 from flask.ext.login import UserMixin, AnonymousUserMixin
 from itsdangerous import (TimedJSONWebSignatureSerializer as Serializer, SignatureExpired, BadSignature)
-from markdown import markdown
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from .exceptions import ValidationError
-from . import db, login_manager
+from .urls import external_url
+from . import db, follow_graph, fragment_cache, last_seen_buffer, login_manager, render_cache
 
 
 class Permission(object):
@@ -24,6 +29,19 @@ class Permission(object):
     ADMIN = 0x80
 
 
+class JSONMixin(object):
+    """Api representation built from `JSON_FIELDS`, a mapping of key to a function of the row."""
+    JSON_FIELDS = {}
+
+    @property
+    def json(self):
+        return self.to_json()
+
+    def to_json(self, fields=None):
+        """Return the keys in `fields`, or every key; unrequested keys are never computed."""
+        return {name: self.JSON_FIELDS[name](self) for name in (self.JSON_FIELDS if fields is None else fields)}
+
+
 class Role(db.Model):
     __tablename__ = 'roles'
     id = db.Column(db.Integer, primary_key=True)
@@ -31,10 +49,29 @@ class Role(db.Model):
     default = db.Column(db.Boolean, default=False, index=True)
     permissions = db.Column(db.Integer)
     users = db.relationship('User', backref='role', lazy='dynamic')
+    _permissions = None
+    _permissions_loaded_at = 0
 
     def __repr__(self):
         return '<Role %r>' % self.name
 
+    @staticmethod
+    def permissions_for(role_id):
+        """Permission bits of role `role_id`, read from an in-process copy of the `roles` table.
+
+        The copy is dropped whenever a role is flushed or the table is created, and reloaded after
+        `FLASKY_PERMISSIONS_CACHE_TTL` seconds to pick up changes made by other processes or by bulk `UPDATE`s.
+        """
+        permissions, ttl = Role._permissions, current_app.config['FLASKY_PERMISSIONS_CACHE_TTL']
+        if permissions is None or (ttl and monotonic() >= Role._permissions_loaded_at + ttl):
+            permissions = Role._permissions = dict(db.session.query(Role.id, Role.permissions))
+            Role._permissions_loaded_at = monotonic()
+        return permissions.get(role_id, 0)
+
+    @staticmethod
+    def clear_permissions_cache(*_, **__):
+        Role._permissions = None
+
     @staticmethod
     def insert_roles():
         roles = {
@@ -51,13 +88,14 @@ class Role(db.Model):
             role.permissions, role.default = role_data
             db.session.add(role)
         db.session.commit()
+        Role.clear_permissions_cache()
         # print('Roles inserted.')
 
 
 class Follow(db.Model):
     __tablename__ = 'follows'
     follower_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
-    followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    followed_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     @staticmethod
@@ -80,7 +118,7 @@ class Follow(db.Model):
         print('%s new follows. %s total follows with %s participants.' % (after - before, after, participants))
 
 
-class User(UserMixin, db.Model):
+class User(UserMixin, JSONMixin, db.Model):
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -97,6 +135,11 @@ class User(UserMixin, db.Model):
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))
 
+    post_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    follower_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    followed_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
     posts = db.relationship('Post', backref='author', lazy='dynamic')
 
     followed = db.relationship('Follow', foreign_keys=[Follow.follower_id],
@@ -107,17 +150,20 @@ class User(UserMixin, db.Model):
                                cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic')
 
+    JSON_FIELDS = {
+        'url': lambda user: external_url('api.get_user', user_id=user.id),
+        'username': lambda user: user.username,
+        'member_since': lambda user: user.member_since,
+        'last_seen': lambda user: user.last_seen,
+        'posts': lambda user: external_url('api.get_user_posts', user_id=user.id),
+        'followed_posts': lambda user: external_url('api.get_user_followed_posts', user_id=user.id),
+        'post_count': lambda user: user.post_count
+    }
+
     @property
-    def json(self):
-        return {
-            'url': url_for('api.get_user', user_id=self.id, _external=True),
-            'username': self.username,
-            'member_since': self.member_since,
-            'last_seen': self.last_seen,
-            'posts': url_for('api.get_user_posts', user_id=self.id, _external=True),
-            'followed_posts': url_for('api.get_user_followed_posts', user_id=self.id, _external=True),
-            'post_count': self.posts.count()
-        }
+    def version(self):
+        """The columns `JSON_FIELDS` read, for validators."""
+        return self.id, self.username, self.member_since, self.last_seen, self.post_count
 
     def __repr__(self):
         return '<User %r>' % self.username
@@ -211,15 +257,17 @@ class User(UserMixin, db.Model):
         return True
 
     def can(self, permissions):
-        return self.role is not None and (self.role.permissions & permissions) == permissions
+        if self.role_id is None or inspect(self).attrs.role.history.has_changes():
+            # role assigned but not flushed yet
+            return self.role is not None and (self.role.permissions & permissions) == permissions
+        return (Role.permissions_for(self.role_id) & permissions) == permissions
 
     @property
     def is_admin(self):
         return self.can(Permission.ADMIN)
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
+        last_seen_buffer.touch(self)
 
     def gravatar(self, size=100, default='monsterid', rating='g'):
         prefix = 'https://secure.' if request.is_secure else 'http://www.'
@@ -249,26 +297,52 @@ class User(UserMixin, db.Model):
         after = User.query.count()
         print('%s users created. %s users total' % (after - before, after))
 
+    @staticmethod
+    def rebuild_counters(chunk_size=1000):
+        users = User.__table__
+        counters = {
+            'post_count': db.select([db.func.count(Post.id)]).where(Post.author_id == users.c.id).as_scalar(),
+            'comment_count': db.select([db.func.count(Comment.id)]).where(Comment.author_id == users.c.id).as_scalar(),
+            'follower_count': db.select([db.func.count()]).where(Follow.followed_id == users.c.id).as_scalar(),
+            'followed_count': db.select([db.func.count()]).where(Follow.follower_id == users.c.id).as_scalar(),
+        }
+        rebuilt = _rebuild_in_chunks(users, counters, chunk_size)
+        print('%s users recounted.' % rebuilt)
+
     def follow(self, user):
-        if not self.is_following(user):
+        if self.follow_for(user) is None:
             follow = Follow(follower=self, followed=user)
             db.session.add(follow)
 
     def unfollow(self, user):
-        follow = self.followed.filter_by(followed_id=user.id).first()
+        follow = self.follow_for(user)
         if follow:
             db.session.delete(follow)
 
+    def follow_for(self, user):
+        """The `Follow` of `user` by this user, read from the database; writes check this, not the follow graph."""
+        return self.followed.filter_by(followed_id=user.id).first()
+
     def is_following(self, user):
-        return self.followed.filter_by(followed_id=user.id).first() is not None
+        if self.id is None or user.id is None:
+            return self.follow_for(user) is not None
+        return follow_graph.is_following(self.id, user.id)
 
     def is_followed_by(self, user):
-        return self.follower.filter_by(follower_id=user.id).first() is not None
+        return user.is_following(self)
+
+    def following_status(self, users):
+        return following_status(self.id, users)
 
     @property
     def followed_posts(self):
         return Post.query.join(Follow, Follow.followed_id == Post.author_id).filter(Follow.follower_id == self.id)
 
+    @property
+    def timeline(self):
+        """`followed_posts` read from the materialized `timeline_entries`; order by `TimelineEntry.timestamp`."""
+        return Post.query.join(TimelineEntry, TimelineEntry.post_id == Post.id).filter(TimelineEntry.user_id == self.id)
+
     @staticmethod
     def add_self_follows():
         for user in User.query.all():
@@ -278,39 +352,54 @@ class User(UserMixin, db.Model):
                 db.session.commit()
 
     def generate_auth_token(self, expiration):
-        serializer = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
-        return serializer.dumps({'id': self.id}).decode('utf-8')
+        """Sign the claims api reads need, so :meth:`verify_auth_token` can authenticate without a query.
+
+        Permission or confirmation changes take effect once the token expires.
+        """
+        claims = {'id': self.id, 'confirmed': self.confirmed,
+                  'permissions': self.role.permissions if self.role is not None else 0}
+        return auth_token_serializer(expiration).dumps(claims).decode('utf-8')
 
     @staticmethod
     def verify_auth_token(token):
-        serializer = Serializer(current_app.config['SECRET_KEY'])
         try:
-            data = serializer.loads(token)
+            claims = auth_token_serializer().loads(token)
         except (SignatureExpired, BadSignature):
-            return False
-        return User.query.get_or_404(data['id'])
+            return None
+        if 'permissions' not in claims:
+            # issued before tokens carried claims
+            return User.query.get(claims['id'])
+        return TokenUser(claims)
+
 
+class Post(JSONMixin, db.Model):
+    ALLOWED_TAGS = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+                    'h1', 'h2', 'h3', 'p']
 
-class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (db.Index('ix_posts_author_id_timestamp', 'author_id', 'timestamp', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
 
+    JSON_FIELDS = {
+        'url': lambda post: external_url('api.get_post', post_id=post.id),
+        'body': lambda post: post.body,
+        'body_html': lambda post: post.body_html,
+        'timestamp': lambda post: post.timestamp,
+        'author': lambda post: external_url('api.get_user', user_id=post.author_id),
+        'comments': lambda post: external_url('api.get_post_comments', post_id=post.id),
+        'comment_count': lambda post: post.comment_count
+    }
+
     @property
-    def json(self):
-        return {
-            'url': url_for('api.get_post', post_id=self.id, _external=True),
-            'body': self.body,
-            'body_html': self.body_html,
-            'timestamp': self.timestamp,
-            'author': url_for('api.get_user', user_id=self.author_id, _external=True),
-            'comments': url_for('api.get_post_comments', post_id=self.id, _external=True),
-            'comment_count': self.comments.count()
-        }
+    def version(self):
+        """The columns `JSON_FIELDS` read, for validators."""
+        return self.id, self.timestamp, self.author_id, self.comment_count, self.body_html
 
     @staticmethod
     def from_json(json_post):
@@ -320,11 +409,19 @@ class Post(db.Model):
         return Post(body=body)
 
     @staticmethod
-    def on_changed_body(target, value, *_):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-                        'h1', 'h2', 'h3', 'p']
-        target.body_html = bleach.linkify(
-            bleach.clean(markdown(value, output_format='html'), tags=allowed_tags, strip=True))
+    def on_changed_body(target, value, oldvalue, _):
+        if value == oldvalue and target.body_html is not None:
+            return
+        target.body_html = render_cache.render(value, Post.ALLOWED_TAGS)
+
+    @staticmethod
+    def rebuild_counters(chunk_size=1000):
+        posts = Post.__table__
+        counters = {
+            'comment_count': db.select([db.func.count(Comment.id)]).where(Comment.post_id == posts.c.id).as_scalar()
+        }
+        rebuilt = _rebuild_in_chunks(posts, counters, chunk_size)
+        print('%s posts recounted.' % rebuilt)
 
     @staticmethod
     def generate_fake(count=100):
@@ -346,26 +443,32 @@ class Post(db.Model):
         print('%s posts created.  %s posts total with %s participants.' % (after - before, after, participants))
 
 
-class Comment(db.Model):
+class Comment(JSONMixin, db.Model):
+    ALLOWED_TAGS = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong']
+
     __tablename__ = 'comments'
+    __table_args__ = (db.Index('ix_comments_post_id_timestamp', 'post_id', 'timestamp', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     disabled = db.Column(db.Boolean)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
 
+    JSON_FIELDS = {
+        'url': lambda comment: external_url('api.get_comment', comment_id=comment.id),
+        'post': lambda comment: external_url('api.get_post', post_id=comment.post_id),
+        'body': lambda comment: comment.body,
+        'body_html': lambda comment: comment.body_html,
+        'timestamp': lambda comment: comment.timestamp,
+        'author': lambda comment: external_url('api.get_user', user_id=comment.author_id)
+    }
+
     @property
-    def json(self):
-        return {
-            'url': url_for('api.get_comment', comment_id=self.id, _external=True),
-            'post': url_for('api.get_post', post_id=self.post_id, _external=True),
-            'body': self.body,
-            'body_html': self.body_html,
-            'timestamp': self.timestamp,
-            'author': url_for('api.get_user', user_id=self.author_id, _external=True)
-        }
+    def version(self):
+        """The columns `JSON_FIELDS` read, for validators."""
+        return self.id, self.timestamp, self.author_id, self.post_id, self.body_html
 
     @staticmethod
     def from_json(json_post):
@@ -375,10 +478,10 @@ class Comment(db.Model):
         return Comment(body=body)
 
     @staticmethod
-    def on_changed_body(target, value, *_):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i', 'strong']
-        target.body_html = bleach.linkify(
-            bleach.clean(markdown(value, output_format='html'), tags=allowed_tags, strip=True))
+    def on_changed_body(target, value, oldvalue, _):
+        if value == oldvalue and target.body_html is not None:
+            return
+        target.body_html = render_cache.render(value, Comment.ALLOWED_TAGS)
 
     @staticmethod
     def generate_fake(count=50):
@@ -405,6 +508,61 @@ class Comment(db.Model):
         print('%s new comments.  %s comments total with %s participants.' % (after - before, after, participants))
 
 
+class TimelineEntry(db.Model):
+    """One row per (follower, followed post), written when posts are created and follows change."""
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (db.Index('ix_timeline_entries_user_id_timestamp', 'user_id', 'timestamp', 'post_id'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    timestamp = db.Column(db.DateTime)
+
+    @staticmethod
+    def backfill(chunk_size=1000):
+        entries, follows, posts = TimelineEntry.__table__, Follow.__table__, Post.__table__
+        max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        for start in range(1, max_id + 1, chunk_size):
+            end = start + chunk_size - 1
+            db.session.execute(entries.delete().where(entries.c.user_id.between(start, end)))
+            db.session.execute(entries.insert().from_select(
+                ['user_id', 'post_id', 'timestamp'],
+                db.select([follows.c.follower_id, posts.c.id, posts.c.timestamp])
+                    .select_from(follows.join(posts, posts.c.author_id == follows.c.followed_id))
+                    .where(follows.c.follower_id.between(start, end))))
+            db.session.commit()
+        print('%s timeline entries written.' % TimelineEntry.query.count())
+
+    @staticmethod
+    def on_post_inserted(_, connection, post):
+        if post.author_id is None:
+            return
+        entries, follows = TimelineEntry.__table__, Follow.__table__
+        connection.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'timestamp'],
+            db.select([follows.c.follower_id, db.literal(post.id), db.literal(post.timestamp, db.DateTime)])
+                .where(follows.c.followed_id == post.author_id)))
+
+    @staticmethod
+    def on_post_deleted(_, connection, post):
+        entries = TimelineEntry.__table__
+        connection.execute(entries.delete().where(entries.c.post_id == post.id))
+
+    @staticmethod
+    def on_follow_inserted(_, connection, follow):
+        entries, posts = TimelineEntry.__table__, Post.__table__
+        connection.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'timestamp'],
+            db.select([db.literal(follow.follower_id), posts.c.id, posts.c.timestamp])
+                .where(posts.c.author_id == follow.followed_id)))
+
+    @staticmethod
+    def on_follow_deleted(_, connection, follow):
+        entries, posts = TimelineEntry.__table__, Post.__table__
+        connection.execute(entries.delete()
+                           .where(entries.c.user_id == follow.follower_id)
+                           .where(entries.c.post_id.in_(db.select([posts.c.id])
+                                                        .where(posts.c.author_id == follow.followed_id))))
+
+
 class AnonymousUser(AnonymousUserMixin):
     is_admin = False
 
@@ -412,11 +570,244 @@ class AnonymousUser(AnonymousUserMixin):
     def can(self, _):
         return False
 
+    # noinspection PyMethodMayBeStatic
+    def following_status(self, users):
+        return following_status(None, users)
+
 
 login_manager.anonymous_user = AnonymousUser
 
-db.event.listen(Post.body, 'set', Post.on_changed_body)
-db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+
+class TokenUser(object):
+    """The bearer of an api auth token, built from its signed claims.
+
+    `id`, `confirmed`, `can` and `is_admin` answer from the claims; any other attribute loads the `User` row on first
+    use.
+    """
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        self.id = claims['id']
+        self.confirmed = claims['confirmed']
+        self.permissions = claims['permissions']
+        self._user = None
+
+    def __eq__(self, other):
+        return other is not None and getattr(other, 'id', None) == self.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = User.query.get_or_404(self.id)
+        return self._user
+
+    def can(self, permissions):
+        return (self.permissions & permissions) == permissions
+
+    @property
+    def is_admin(self):
+        return self.can(Permission.ADMIN)
+
+    def following_status(self, users):
+        return following_status(self.id, users)
+
+
+_auth_token_serializers = {}
+
+
+def auth_token_serializer(expiration=None):
+    """Return the shared auth token serializer for the current `SECRET_KEY` and `expiration`."""
+    key = (current_app.config['SECRET_KEY'], expiration)
+    serializer = _auth_token_serializers.get(key)
+    if serializer is None:
+        serializer = _auth_token_serializers[key] = Serializer(*key)
+    return serializer
+
+
+FollowStatus = namedtuple('FollowStatus', 'following followed_by')
+_NO_FOLLOW = FollowStatus(False, False)
+
+
+def following_status(viewer_id, users):
+    """Map each of `users`' ids to a `FollowStatus` between it and the viewer, for a whole page at once.
+
+    Answers come from the follow graph, so a page of any size costs no query; an anonymous or unsaved viewer follows
+    no one.
+    """
+    if viewer_id is None:
+        return {user.id: _NO_FOLLOW for user in users}
+    return {user.id: FollowStatus(follow_graph.is_following(viewer_id, user.id),
+                                  follow_graph.is_following(user.id, viewer_id)) for user in users}
+
+
+def preload(instances, *relationships):
+    """Load the many-to-one `relationships` of `instances` with one IN query per relationship.
+
+    Templates can then walk `post.author` or `comment.post` for a whole page without a lazy load per row.
+    """
+    for name in relationships:
+        pending = [instance for instance in instances if name not in instance.__dict__]
+        if not pending:
+            continue
+        mapper = inspect(type(pending[0]))
+        prop = mapper.get_property(name)
+        (local, remote), = prop.local_remote_pairs
+        local_key = mapper.get_property_by_column(local).key
+        remote_key = prop.mapper.get_property_by_column(remote).key
+
+        session = db.object_session(pending[0]) or db.session
+        related = {}
+        missing = set()
+        for key in set(getattr(instance, local_key) for instance in pending) - {None}:
+            instance = session.identity_map.get(identity_key(prop.mapper.class_, key))
+            if instance is None or inspect(instance).expired:
+                missing.add(key)
+            else:
+                related[key] = instance
+        if missing:
+            for instance in prop.mapper.class_.query.filter(remote.in_(missing)):
+                related[getattr(instance, remote_key)] = instance
+
+        for instance in pending:
+            set_committed_value(instance, name, related.get(getattr(instance, local_key)))
+    return instances
+
+
+def _rebuild_in_chunks(table, counters, chunk_size):
+    """Recompute `counters` for every row of `table`, committing every `chunk_size` ids."""
+    max_id = db.session.query(db.func.max(table.c.id)).scalar() or 0
+    for start in range(1, max_id + 1, chunk_size):
+        db.session.execute(table.update().where(table.c.id.between(start, start + chunk_size - 1)).values(counters))
+        db.session.commit()
+    return db.session.query(db.func.count(table.c.id)).scalar()
+
+
+def rerender(model, chunk_size=1000, workers=None, start_after=0):
+    """Re-render `model.body_html` for every row with an id above `start_after`.
+
+    Rows stream in id order, `chunk_size` at a time.  Each chunk is rendered across a pool of `workers` processes
+    (one per core by default), and the rows whose html changed are written back with one executemany UPDATE.  Every
+    chunk commits on its own and the last id is printed, so an interrupted run resumes with `start_after`.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import cpu_count
+    from .rendering import render_batch
+
+    table = model.__table__
+    workers = workers or cpu_count()
+    update = table.update().where(table.c.id == db.bindparam('_id')).values(body_html=db.bindparam('_html'))
+    total = db.session.query(db.func.count(table.c.id)).filter(table.c.id > start_after).scalar()
+    done = changed = 0
+    last_id = start_after
+
+    with ProcessPoolExecutor(workers) as pool:
+        while True:
+            rows = [tuple(row) for row in db.session.query(table.c.id, table.c.body, table.c.body_html)
+                    .filter(table.c.id > last_id).order_by(table.c.id).limit(chunk_size)]
+            if not rows:
+                break
+            batches = [rows[i::workers] for i in range(workers)]
+            results = [result for batch in pool.map(render_batch, [model.ALLOWED_TAGS] * workers, batches)
+                       for result in batch]
+            if results:
+                db.session.execute(update, [{'_id': id_, '_html': html} for id_, html in results])
+            db.session.commit()
+
+            done += len(rows)
+            changed += len(results)
+            last_id = rows[-1][0]
+            print('%s: %s/%s rows re-rendered, %s changed, last id %s' % (table.name, done, total, changed, last_id))
+
+
+def counter(model, column, foreign_key, delta):
+    """Mapper event listener that adds `delta` to `model.column` for the row referenced by `foreign_key`.
+
+    The UPDATE runs on the flushing connection, so it commits or rolls back with the row that triggered it.
+    """
+    table = model.__table__
+
+    def listener(_, connection, target):
+        key = getattr(target, foreign_key)
+        if key is None:
+            return
+        connection.execute(table.update().where(table.c.id == key).values({column: table.c[column] + delta}))
+        db.object_session(target).info.setdefault('stale_counters', set()).add((model, key, column))
+
+    return listener
+
+
+def expire_counters(session, _):
+    """Expire the counters bumped during a flush on any instance the session already holds."""
+    for model, key, column in session.info.pop('stale_counters', ()):
+        instance = session.identity_map.get(identity_key(model, key))
+        if instance is not None:
+            session.expire(instance, [column])
+
+
+def invalidate_fragments(kind):
+    """Listener factory that drops the cached template fragments of a changed row."""
+
+    def listener(mapper, connection, target):
+        if kind == 'user':
+            if any(inspect(target).attrs[name].history.has_changes() for name in ('username', 'avatar_hash')):
+                fragment_cache.invalidate_author(target.id)
+        else:
+            fragment_cache.invalidate(kind, target.id)
+            if kind == 'comment':
+                fragment_cache.invalidate('post', target.post_id)
+
+    return listener
+
+
+db.event.listen(Role, 'after_insert', Role.clear_permissions_cache)
+db.event.listen(Role, 'after_update', Role.clear_permissions_cache)
+db.event.listen(Role, 'after_delete', Role.clear_permissions_cache)
+db.event.listen(Role.__table__, 'after_create', Role.clear_permissions_cache)
+
+db.event.listen(Post.body, 'set', Post.on_changed_body, active_history=True)
+db.event.listen(Comment.body, 'set', Comment.on_changed_body, active_history=True)
+
+db.event.listen(Post, 'after_insert', counter(User, 'post_count', 'author_id', 1))
+db.event.listen(Post, 'after_delete', counter(User, 'post_count', 'author_id', -1))
+db.event.listen(Comment, 'after_insert', counter(Post, 'comment_count', 'post_id', 1))
+db.event.listen(Comment, 'after_delete', counter(Post, 'comment_count', 'post_id', -1))
+db.event.listen(Comment, 'after_insert', counter(User, 'comment_count', 'author_id', 1))
+db.event.listen(Comment, 'after_delete', counter(User, 'comment_count', 'author_id', -1))
+db.event.listen(Follow, 'after_insert', counter(User, 'followed_count', 'follower_id', 1))
+db.event.listen(Follow, 'after_delete', counter(User, 'followed_count', 'follower_id', -1))
+db.event.listen(Follow, 'after_insert', counter(User, 'follower_count', 'followed_id', 1))
+db.event.listen(Follow, 'after_delete', counter(User, 'follower_count', 'followed_id', -1))
+db.event.listen(Session, 'after_flush_postexec', expire_counters)
+
+db.event.listen(Post, 'after_update', invalidate_fragments('post'))
+db.event.listen(Post, 'after_delete', invalidate_fragments('post'))
+db.event.listen(Comment, 'after_insert', invalidate_fragments('comment'))
+db.event.listen(Comment, 'after_update', invalidate_fragments('comment'))
+db.event.listen(Comment, 'after_delete', invalidate_fragments('comment'))
+db.event.listen(User, 'after_update', invalidate_fragments('user'))
+
+db.event.listen(Follow, 'after_insert', follow_graph.on_inserted)
+db.event.listen(Follow, 'after_delete', follow_graph.on_deleted)
+db.event.listen(Session, 'after_commit', follow_graph.on_commit)
+db.event.listen(Session, 'after_soft_rollback', follow_graph.on_rollback)
+db.event.listen(Follow.__table__, 'after_create', follow_graph.reset)
+db.event.listen(Follow.__table__, 'before_drop', follow_graph.reset)
+
+db.event.listen(Post, 'after_insert', TimelineEntry.on_post_inserted)
+db.event.listen(Post, 'after_delete', TimelineEntry.on_post_deleted)
+db.event.listen(Follow, 'after_insert', TimelineEntry.on_follow_inserted)
+db.event.listen(Follow, 'after_delete', TimelineEntry.on_follow_deleted)
 
 
 @login_manager.user_loader
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import hashlib
+
+import bleach
+from markdown import markdown
+
+from .cache import LRUCache
+
+
+def render_markdown(body, allowed_tags):
+    return bleach.linkify(bleach.clean(markdown(body, output_format='html'), tags=allowed_tags, strip=True))
+
+
+def render_batch(allowed_tags, rows):
+    """Render `(id, body, body_html)` rows, returning `(id, html)` for the rows whose html changed.
+
+    Runs in the worker processes of `manage.py rerender`, so it must stay a picklable, app-free function.
+    """
+    rendered = ((id_, render_markdown(body, allowed_tags), body_html) for id_, body, body_html in rows if body)
+    return [(id_, html) for id_, html, body_html in rendered if html != body_html]
+
+
+class RenderCache(object):
+    """Content-addressed cache of :func:`render_markdown` output.
+
+    Keys are the SHA-1 of the body plus the allowed-tag profile, so duplicate bodies render once per profile and a
+    changed tag list never serves stale html.
+    """
+
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache.resize(app.config['FLASKY_RENDER_CACHE_SIZE'])
+
+    def render(self, body, allowed_tags):
+        key = (tuple(allowed_tags), hashlib.sha1(body.encode('utf-8')).hexdigest())
+        html = self.cache.get(key)
+        if html is None:
+            html = render_markdown(body, allowed_tags)
+            self.cache.set(key, html)
+        return html
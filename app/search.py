@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import re
+
+from sqlalchemy import Column, DDL, Integer, MetaData, Table, Text, inspect
+
+from . import db
+from .models import Comment, Post
+
+
+def match_expression(q):
+    """Quote each word of `q` for FTS5 MATCH, so user input never reaches the query syntax; the last is a prefix."""
+    terms = re.findall(r'\w+', q or '')
+    return ' '.join('"%s"' % term for term in terms) + ('*' if terms else '')
+
+
+class FullTextIndex(object):
+    """SQLite FTS5 index `<table>_fts` over `model.body`, with the rowid equal to the row's id.
+
+    The virtual table is created and dropped with the metadata and kept in sync by mapper events on `model`.  Other
+    dialects get no index and :meth:`search` falls back to `LIKE`.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.name = '%s_fts' % model.__tablename__
+        self.table = Table(self.name, MetaData(), Column('rowid', Integer), Column('body', Text), Column('rank'))
+
+        db.event.listen(db.metadata, 'after_create',
+                        DDL('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(body)' % self.name).execute_if(
+                            dialect='sqlite'))
+        db.event.listen(db.metadata, 'before_drop', DDL('DROP TABLE IF EXISTS %s' % self.name).execute_if(
+            dialect='sqlite'))
+        db.event.listen(model, 'after_insert', self.on_inserted)
+        db.event.listen(model, 'after_update', self.on_updated)
+        db.event.listen(model, 'after_delete', self.on_deleted)
+
+    def search(self, q):
+        """`model.query` narrowed to rows matching every word of `q`, best match first."""
+        query = self.model.query
+        expression = match_expression(q)
+        if not expression:
+            return query.filter(db.false())
+        if db.engine.dialect.name != 'sqlite':
+            terms = [self.model.body.ilike('%%%s%%' % term) for term in re.findall(r'\w+', q)]
+            return query.filter(*terms).order_by(self.model.timestamp.desc())
+        match = db.text('%s MATCH :match' % self.name).bindparams(match=expression)
+        return query.join(self.table, self.table.c.rowid == self.model.id).filter(match).order_by(self.table.c.rank)
+
+    def rebuild(self):
+        """Rebuild the index from the model's table in one pass and return the number of rows indexed."""
+        source = self.model.__table__
+        db.session.execute(self.table.delete())
+        rows = db.session.execute(self.table.insert().from_select(
+            ['rowid', 'body'], db.select([source.c.id, source.c.body]))).rowcount
+        db.session.execute(db.text("INSERT INTO %s(%s) VALUES ('optimize')" % (self.name, self.name)))
+        db.session.commit()
+        print('%s: %s rows indexed.' % (self.name, rows))
+        return rows
+
+    def on_inserted(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            connection.execute(self.table.insert().values(rowid=target.id, body=target.body))
+
+    def on_updated(self, mapper, connection, target):
+        if inspect(target).attrs.body.history.has_changes():
+            self.on_deleted(mapper, connection, target)
+            self.on_inserted(mapper, connection, target)
+
+    def on_deleted(self, mapper, connection, target):
+        if connection.dialect.name == 'sqlite':
+            connection.execute(self.table.delete().where(self.table.c.rowid == target.id))
+
+
+indexes = {'posts': FullTextIndex(Post), 'comments': FullTextIndex(Comment)}
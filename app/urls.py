@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from flask import current_app, has_request_context, request, url_for
+
+from .cache import LRUCache
+
+_SENTINEL = 8675309017
+_templates = LRUCache(maxsize=256)
+
+
+def external_url(endpoint, **values):
+    """Same as ``url_for(endpoint, _external=True, **values)`` for one integer url argument, without the routing.
+
+    The url is built once per app, url root and endpoint with a sentinel id, and later calls splice the id into
+    the cached halves.  The cache is bounded because the url root comes from the client's `Host` header.
+    """
+    (name, value), = values.items()
+    key = (current_app._get_current_object(), request.url_root if has_request_context() else None, endpoint, name)
+    template = _templates.get(key)
+    if template is None:
+        template = tuple(url_for(endpoint, _external=True, **{name: _SENTINEL}).split(str(_SENTINEL)))
+        _templates.set(key, template)
+    if len(template) != 2 or type(value) is not int:
+        return url_for(endpoint, _external=True, **values)
+    return template[0] + str(value) + template[1]
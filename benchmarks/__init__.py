@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from app import create_app
+from config import config
+
+
+def make_app(base, database_uri, **overrides):
+    """`create_app` for the config named `base`, on `database_uri` and with `overrides` applied."""
+    name = 'benchmark'
+    settings = dict(overrides, SQLALCHEMY_DATABASE_URI=database_uri)
+    config[name] = type('BenchmarkConfig', (config[base],), settings)
+    try:
+        return create_app(name)
+    finally:
+        del config[name]
+
+
+def percentile(values, fraction):
+    return sorted(values)[int(fraction * (len(values) - 1))] if values else 0.0
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Latency, throughput and queries per request of the key endpoints over seeded datasets.
+
+    python manage.py bench --datasets 1k,100k,1m --requests 50
+    python manage.py bench --datasets 1k --save
+
+Each dataset is generated once by `FakeDataGenerator` into tmp/bench/ and reused while its post count matches.
+Requests go through the test client one at a time, as the user who follows the most others, promoted to
+administrator so `moderate` and the export are reachable; api calls use their auth token.  Results are compared with
+the saved baseline: a p95 more than `tolerance` slower, or any extra query per request, is a regression.
+"""
+
+import json
+from base64 import b64encode
+from collections import OrderedDict
+from time import monotonic
+
+from flask import url_for
+from flask.ext.sqlalchemy import get_debug_queries
+
+from app import db
+from app.fake import FakeDataGenerator
+from app.models import Comment, Post, Role, User
+from config import ROOT_DIR
+from . import make_app, percentile
+
+DATASETS = OrderedDict([
+    ('1k', {'users': 100, 'posts': 1000, 'comments': 2000}),
+    ('100k', {'users': 10000, 'posts': 100000, 'comments': 200000}),
+    ('1m', {'users': 100000, 'posts': 1000000, 'comments': 2000000}),
+])
+DATA_DIR = ROOT_DIR / 'tmp' / 'bench'
+BASELINE = ROOT_DIR / 'benchmarks' / 'baseline.json'
+
+
+def seed(name):
+    """Generate dataset `name` unless its database already holds it."""
+    posts = DATASETS[name]['posts']
+    if db.engine.dialect.has_table(db.engine, 'posts') and Post.query.count() == posts:
+        return
+    print('Seeding %s...' % name)
+    db.drop_all()
+    db.create_all()
+    Role.insert_roles()
+    FakeDataGenerator(seed=0, **DATASETS[name]).run()
+
+
+def _basic(username, password=''):
+    return {'Authorization': 'Basic ' + b64encode(('%s:%s' % (username, password)).encode('utf-8')).decode('utf-8')}
+
+
+def scenarios():
+    """`(label, url, headers)` for every endpoint, against the busiest rows of the dataset."""
+    viewer = User.query.order_by(User.followed_count.desc(), User.id).first()
+    viewer.role = Role.query.filter_by(name='Administrator').first()
+    db.session.commit()
+    author = User.query.order_by(User.post_count.desc(), User.id).first()
+    post = Post.query.order_by(Post.comment_count.desc(), Post.id).first()
+    comment = post.comments.order_by(Comment.id).first()
+    last_post_id = db.session.query(db.func.max(Post.id)).scalar()
+    user_ids = ','.join(str(user_id) for user_id, in db.session.query(User.id).order_by(User.id).limit(20))
+    token = _basic(viewer.generate_auth_token(expiration=3600))
+
+    return viewer, [
+        ('main.index', url_for('main.index'), None),
+        ('main.index followed', url_for('main.index'), 'followed'),
+        ('main.user_profile', url_for('main.user_profile', username=author.username), None),
+        ('main.show_post', url_for('main.show_post', post_id=post.id), None),
+        ('main.moderate', url_for('main.moderate'), None),
+        ('api.get_token', url_for('api.get_token'), _basic(viewer.email, 'secret')),
+        ('api.get_posts', url_for('api.get_posts'), token),
+        ('api.get_post', url_for('api.get_post', post_id=post.id), token),
+        ('api.get_comments', url_for('api.get_comments'), token),
+        ('api.get_comment', url_for('api.get_comment', comment_id=comment.id), token),
+        ('api.get_post_comments', url_for('api.get_post_comments', post_id=post.id), token),
+        ('api.get_users', url_for('api.get_users', ids=user_ids), token),
+        ('api.get_user', url_for('api.get_user', user_id=author.id), token),
+        ('api.get_user_posts', url_for('api.get_user_posts', user_id=author.id), token),
+        ('api.get_user_followed_posts', url_for('api.get_user_followed_posts', user_id=viewer.id), token),
+        ('api.search', url_for('api.search', q='dolor'), token),
+        ('api.export', url_for('api.export', name='posts', since=last_post_id - 100), token),
+    ]
+
+
+def measure(client, url, headers, requests, warmup=3):
+    latencies, queries = [], []
+    for i in range(warmup + requests):
+        del get_debug_queries()[:]
+        started = monotonic()
+        response = client.get(url, headers=headers)
+        response.get_data()
+        elapsed = monotonic() - started
+        if response.status_code != 200:
+            raise RuntimeError('%s answered %d' % (url, response.status_code))
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(len(get_debug_queries()))
+        # what the teardown of a request's own app context would do
+        db.session.remove()
+    return {'p50': percentile(latencies, 0.50) * 1000, 'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000, 'rps': len(latencies) / sum(latencies),
+            'queries': sum(queries) / len(queries)}
+
+
+def run_dataset(name, requests):
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    app = make_app('production', 'sqlite:///%s' % (DATA_DIR / ('%s.sqlite' % name)), DEBUG=False,
+                   SERVER_NAME='localhost', WTF_CSRF_ENABLED=False, SQLALCHEMY_RECORD_QUERIES=True,
+                   SQLALCHEMY_BINDS=None, FLASKY_DB_REPLICAS=(), FLASKY_MAIL_WORKERS=0)
+    with app.test_request_context():
+        seed(name)
+        viewer, endpoints = scenarios()
+        client, followed_client = app.test_client(), app.test_client()
+        for each in (client, followed_client):
+            each.post(url_for('auth.login'), data={'email': viewer.email, 'password': 'secret'})
+        followed_client.set_cookie('localhost', 'show_followed', '1')
+
+        results = OrderedDict()
+        for label, url, headers in endpoints:
+            if headers == 'followed':
+                results[label] = measure(followed_client, url, None, requests)
+            else:
+                results[label] = measure(client, url, headers, requests)
+        return results
+
+
+def compare(name, results, baseline, tolerance):
+    """Print `results` next to `baseline` and return the regressions."""
+    regressions = []
+    print('\n%s posts' % name)
+    print('%-30s %9s %9s %9s %9s %8s %10s' % ('endpoint', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries',
+                                               'p95 vs base'))
+    for label, result in results.items():
+        base = baseline.get(label)
+        change = ''
+        if base:
+            change = '%+.0f%%' % ((result['p95'] / base['p95'] - 1) * 100)
+            if result['p95'] > base['p95'] * (1 + tolerance):
+                regressions.append('%s %s: p95 %.1fms, baseline %.1fms' % (name, label, result['p95'], base['p95']))
+            if result['queries'] > base['queries']:
+                regressions.append('%s %s: %.1f queries per request, baseline %.1f' % (
+                    name, label, result['queries'], base['queries']))
+        print('%-30s %9.1f %9.1f %9.1f %9.0f %8.1f %10s' % (label, result['p50'], result['p95'], result['p99'],
+                                                             result['rps'], result['queries'], change))
+    return regressions
+
+
+def run(datasets=('1k', '100k', '1m'), requests=50, baseline=BASELINE, tolerance=0.25, save=False):
+    """Benchmark `datasets` and return whether they are free of regressions against `baseline`."""
+    try:
+        with open(str(baseline)) as stream:
+            saved = json.load(stream)
+    except FileNotFoundError:
+        saved = {}
+    regressions = []
+    for name in datasets:
+        results = run_dataset(name, requests)
+        regressions += compare(name, results, saved.get(name, {}), tolerance)
+        if save:
+            saved[name] = results
+
+    if save:
+        with open(str(baseline), 'w') as stream:
+            json.dump(saved, stream, indent=2, sort_keys=True)
+        print('\nBaseline saved to %s' % baseline)
+    if regressions:
+        print('\n%d REGRESSIONS against %s:' % (len(regressions), baseline))
+        for regression in regressions:
+            print('  ' + regression)
+    return not regressions
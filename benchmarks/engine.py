@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Concurrent read/write throughput of SQLite under the engine settings in config.py.
+
+    python manage.py bench_engine --seconds 5 --readers 8 --writers 2
+
+Each profile gets a fresh database file seeded with users and posts.  Readers run the home page's post query and
+writers the per-request `last_seen` update, one transaction per operation the way requests use the engine.  `default`
+is SQLite as it comes: a rollback journal with full fsyncs and a connection per checkout.
+"""
+
+import os
+import shutil
+import tempfile
+from random import Random
+from threading import Thread
+from time import monotonic
+
+from sqlalchemy import select
+
+from app import db
+from . import make_app, percentile
+
+PROFILES = (
+    ('default', 'production', {'FLASKY_SQLITE_PRAGMAS': {}, 'SQLALCHEMY_POOL_SIZE': None}),
+    ('development', 'development', {}),
+    ('production', 'production', {}),
+)
+
+
+def seed(engine, users, posts):
+    users_table, posts_table = db.metadata.tables['users'], db.metadata.tables['posts']
+    db.metadata.create_all(engine)
+    engine.execute(users_table.insert(), [{'id': i, 'email': 'user%d@example.com' % i, 'username': 'user%d' % i}
+                                          for i in range(1, users + 1)])
+    engine.execute(posts_table.insert(), [{'body': 'post %d' % i, 'body_html': '<p>post %d</p>' % i,
+                                           'author_id': i % users + 1} for i in range(posts)])
+
+
+def read(engine, rng, users):
+    users_table, posts_table = db.metadata.tables['users'], db.metadata.tables['posts']
+    query = select([posts_table, users_table.c.username]).select_from(
+        posts_table.join(users_table, posts_table.c.author_id == users_table.c.id)).order_by(
+        posts_table.c.timestamp.desc()).limit(20).offset(rng.randrange(50) * 20)
+    with engine.connect() as connection:
+        connection.execute(query).fetchall()
+
+
+def write(engine, rng, users):
+    users_table = db.metadata.tables['users']
+    with engine.begin() as connection:
+        connection.execute(users_table.update().where(users_table.c.id == rng.randint(1, users)).values(
+            last_seen=db.func.current_timestamp()))
+
+
+def worker(operation, engine, users, deadline, seed_, results):
+    rng = Random(seed_)
+    latencies, errors = [], 0
+    while monotonic() < deadline:
+        started = monotonic()
+        try:
+            operation(engine, rng, users)
+        except Exception:
+            errors += 1
+        else:
+            latencies.append(monotonic() - started)
+    results.append((latencies, errors))
+
+
+def measure(engine, seconds, readers, writers, users):
+    reads, writes = [], []
+    deadline = monotonic() + seconds
+    threads = [Thread(target=worker, args=(read, engine, users, deadline, i, reads)) for i in range(readers)]
+    threads += [Thread(target=worker, args=(write, engine, users, deadline, -i - 1, writes)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [(sum((latencies for latencies, _ in results), []), sum(errors for _, errors in results))
+            for results in (reads, writes)]
+
+
+def run(seconds=5, readers=8, writers=2, users=100, posts=2000):
+    print('%d readers, %d writers, %gs per profile' % (readers, writers, seconds))
+    print('%-12s %10s %10s %10s %10s %8s' % ('profile', 'reads/s', 'read p95', 'writes/s', 'write p95', 'errors'))
+    for name, base, overrides in PROFILES:
+        directory = tempfile.mkdtemp(prefix='flasky-bench-')
+        try:
+            app = make_app(base, 'sqlite:///%s' % os.path.join(directory, 'bench.sqlite'), DEBUG=False,
+                           SQLALCHEMY_RECORD_QUERIES=False, **overrides)
+            engine = db.get_engine(app)
+            seed(engine, users, posts)
+            (read_latencies, read_errors), (write_latencies, write_errors) = measure(engine, seconds, readers,
+                                                                                     writers, users)
+            engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+        print('%-12s %10.0f %8.1fms %10.0f %8.1fms %8d' % (
+            name, len(read_latencies) / seconds, percentile(read_latencies, 0.95) * 1000,
+            len(write_latencies) / seconds, percentile(write_latencies, 0.95) * 1000, read_errors + write_errors))
@@ -21,11 +21,41 @@ class Config(object):
 
     FLASKY_MAIL_SUBJECT_PREFIX = '[Flasky]'
     FLASKY_MAIL_SENDER = 'Flasky Admin <no-reply@flasky.com>'
+    FLASKY_MAIL_WORKERS = 2
+    FLASKY_MAIL_QUEUE_SIZE = 1000
+    FLASKY_MAIL_QUEUE_TIMEOUT = 1
+    FLASKY_MAIL_BATCH_SIZE = 50
+    FLASKY_MAIL_RETRIES = 3
+    FLASKY_MAIL_RETRY_DELAY = 1
     FLASKY_ADMIN = 'Manu Phatak <admin@flasky.com>'
     FLASKY_ADMIN_EMAIL = 'admin@flasky.com'
     FLASKY_POSTS_PER_PAGE = 20
     FLASKY_FOLLOWERS_PER_PAGE = 50
     FLASKY_COMMENTS_PER_PAGE = 30
+    FLASKY_API_MAX_IDS = 100
+    FLASKY_QUERY_BUDGET_STRICT = False
+    FLASKY_RENDER_CACHE_SIZE = 4096
+    FLASKY_FRAGMENT_CACHE_SIZE = 4096
+    FLASKY_AUTH_CACHE_SIZE = 1024
+    FLASKY_AUTH_CACHE_TTL = 60
+    FLASKY_LAST_SEEN_RESOLUTION = 60
+    FLASKY_LAST_SEEN_FLUSH_INTERVAL = 10
+    FLASKY_FOLLOW_GRAPH_TTL = 60
+    FLASKY_PERMISSIONS_CACHE_TTL = 60
+    # SQLALCHEMY_BINDS keys of read replicas for GET requests to these blueprints; see app.engine.RoutingSession
+    FLASKY_DB_REPLICAS = ()
+    FLASKY_DB_REPLICA_BLUEPRINTS = ('main', 'api')
+    FLASKY_DB_PIN_SECONDS = 5
+    # Server-Timing headers and the admin slow request page; see app.instrumentation
+    FLASKY_INSTRUMENTATION = bool(os.environ.get('FLASKY_INSTRUMENTATION'))
+    FLASKY_SLOW_REQUEST_MS = 250
+    FLASKY_SLOW_REQUESTS = 100
+    # run on every new SQLite connection, busy_timeout first; server databases ignore them
+    FLASKY_SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+    }
 
     @staticmethod
     def init_app(app):
@@ -39,6 +69,7 @@ class DevelopmentConfig(Config):
     FLASKY_POSTS_PER_PAGE = 5
     FLASKY_FOLLOWERS_PER_PAGE = 5
     FLASKY_COMMENTS_PER_PAGE = 5
+    FLASKY_SQLITE_PRAGMAS = dict(Config.FLASKY_SQLITE_PRAGMAS, cache_size=-16000, mmap_size=64 * 2 ** 20)
 
 
 class TestingConfig(Config):
@@ -46,10 +77,20 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///%s' % (ROOT_DIR / 'db-test.sqlite')
     WTF_CSRF_ENABLED = False
     SERVER_NAME = 'localhost'
+    FLASKY_QUERY_BUDGET_STRICT = True
+    FLASKY_LAST_SEEN_FLUSH_INTERVAL = 0
+    FLASKY_MAIL_WORKERS = 0
+    # a throwaway database: skip the journal fsyncs
+    FLASKY_SQLITE_PRAGMAS = dict(Config.FLASKY_SQLITE_PRAGMAS, journal_mode='memory', synchronous='off')
 
 
 class ProductionConfig(Config):
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///%s' % (ROOT_DIR / 'db.sqlite')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///%s' % (ROOT_DIR / 'db.sqlite')
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if 'DATABASE_REPLICA_URL' in os.environ else None
+    FLASKY_DB_REPLICAS = tuple(SQLALCHEMY_BINDS or ())
+    SQLALCHEMY_POOL_SIZE = 10
+    SQLALCHEMY_POOL_RECYCLE = 3600
+    FLASKY_SQLITE_PRAGMAS = dict(Config.FLASKY_SQLITE_PRAGMAS, cache_size=-64000, mmap_size=256 * 2 ** 20)
 
 
 config = {
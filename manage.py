@@ -2,6 +2,7 @@
 # coding=utf-8
 
 import os
+import sys
 
 from flask.ext.migrate import MigrateCommand, Migrate
 from flask.ext.script import Manager
@@ -16,17 +17,23 @@ if os.environ.get('FLASK_COVERAGE'):
 
 from app import create_app, db
 from app.email import send_email
-from app.models import User, Role, Permission, Post, Follow, Comment
+from app.models import User, Role, Permission, Post, Follow, Comment, TimelineEntry, rerender as rerender_bodies
 
 app = create_app(os.getenv('FLASK_CONFIG', 'default'))
 
+
+def include_object(object_, name, type_, reflected, compare_to):
+    # keep autogenerate away from the full-text search tables app.search creates
+    return not (type_ == 'table' and reflected and compare_to is None and '_fts' in name)
+
+
 manager = Manager(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, include_object=include_object)
 
 
 def make_shell_context():
     return dict(app=app, db=db, send_email=send_email, User=User, Role=Role, Post=Post, Permission=Permission,
-                Follow=Follow, Comment=Comment)
+                Follow=Follow, Comment=Comment, TimelineEntry=TimelineEntry)
 
 
 manager.add_command('shell', Shell(make_context=make_shell_context))
@@ -57,20 +64,94 @@ def test(coverage=False):
         COV.erase()
 
 
-@manager.command
-def generate_fake():
+@manager.option('-u', '--users', type=int, default=100)
+@manager.option('-p', '--posts', type=int, default=1000)
+@manager.option('-c', '--comments', type=int, default=2000)
+@manager.option('-f', '--follows', type=int, default=20, help='average follows per user')
+@manager.option('-k', '--skew', type=float, default=1.2, help='power-law exponent of authorship and followers')
+@manager.option('-s', '--seed', type=int, default=0)
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=10000)
+def generate_fake(users, posts, comments, follows, skew, seed, batch_size):
     """Generate fake data"""
+    from app.fake import FakeDataGenerator
+
     Role.insert_roles()
 
-    admin = User(email='admin@flasky.com', password='secret', confirmed=True, username='Admin')
-    db.session.add(admin)
-    db.session.commit()
-    print('Inserting admin user: admin@flasky.com')
+    if not User.query.filter_by(email='admin@flasky.com').first():
+        admin = User(email='admin@flasky.com', password='secret', confirmed=True, username='Admin')
+        db.session.add(admin)
+        db.session.commit()
+        print('Inserting admin user: admin@flasky.com')
+
+    FakeDataGenerator(users=users, posts=posts, comments=comments, follows=follows, skew=skew, seed=seed,
+                      batch_size=batch_size).run()
 
-    User.generate_fake()
-    Post.generate_fake()
-    Comment.generate_fake()
-    Follow.generate_fake()
+
+@manager.command
+def rebuild_counters(chunk_size=1000):
+    """Recompute the denormalized post, comment and follow counters"""
+    User.rebuild_counters(chunk_size=int(chunk_size))
+    Post.rebuild_counters(chunk_size=int(chunk_size))
+
+
+@manager.command
+def backfill_timeline(chunk_size=1000):
+    """Rebuild the materialized home timelines from follows and posts"""
+    TimelineEntry.backfill(chunk_size=int(chunk_size))
+
+
+@manager.command
+def rerender(model='all', chunk_size=1000, workers=0, start_after=0):
+    """Re-render body_html for posts and/or comments across all cores"""
+    models = {'posts': [Post], 'comments': [Comment], 'all': [Post, Comment]}[model]
+    for model in models:
+        rerender_bodies(model, chunk_size=int(chunk_size), workers=int(workers), start_after=int(start_after))
+
+
+@manager.command
+def reindex(model='all'):
+    """Rebuild the full-text search index of posts and/or comments"""
+    from app.search import indexes
+
+    for name in sorted(indexes) if model == 'all' else [model]:
+        indexes[name].rebuild()
+
+
+@manager.command
+def export(model='posts', since=None, output=None, chunk_size=1000):
+    """Stream posts or comments as newline-delimited json, optionally only those after an id or from a timestamp"""
+    from app.export import export_ndjson
+
+    stream = open(output, 'w') if output else sys.stdout
+    try:
+        stream.writelines(export_ndjson(model, since, chunk_size=int(chunk_size)))
+    finally:
+        if output:
+            stream.close()
+
+
+@manager.option('-s', '--seconds', type=float, default=5)
+@manager.option('-r', '--readers', type=int, default=8)
+@manager.option('-w', '--writers', type=int, default=2)
+def bench_engine(seconds, readers, writers):
+    """Compare concurrent read/write throughput of the SQLite engine profiles"""
+    from benchmarks.engine import run
+
+    run(seconds=seconds, readers=readers, writers=writers)
+
+
+@manager.option('-d', '--datasets', default='1k,100k,1m', help='comma-separated, of 1k, 100k and 1m')
+@manager.option('-n', '--requests', type=int, default=50, help='timed requests per endpoint')
+@manager.option('-t', '--tolerance', type=float, default=0.25, help='allowed p95 slowdown over the baseline')
+@manager.option('-b', '--baseline', default=None, help='baseline json, benchmarks/baseline.json by default')
+@manager.option('--save', action='store_true', help='save the results as the new baseline')
+def bench(datasets, requests, tolerance, baseline, save):
+    """Benchmark the key endpoints over seeded datasets and compare with the saved baseline"""
+    from benchmarks.endpoints import BASELINE, run
+
+    if not run(datasets.split(','), requests=requests, baseline=baseline or BASELINE, tolerance=tolerance,
+               save=save):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,29 @@
+"""Full-text search indexes on posts and comments
+
+Revision ID: 6a2e9d04b7c
+Revises: 5f93c0e2d7b
+Create Date: 2026-10-18 15:02:47.318224
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a2e9d04b7c'
+down_revision = '5f93c0e2d7b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in ('posts', 'comments'):
+        op.execute('CREATE VIRTUAL TABLE %s_fts USING fts5(body)' % table)
+        op.execute('INSERT INTO %s_fts(rowid, body) SELECT id, body FROM %s' % (table, table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in ('comments', 'posts'):
+        op.execute('DROP TABLE %s_fts' % table)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import url_for
+from flask.ext.sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Role, User, Post, Comment
+from app.search import indexes
+from app.urls import external_url
+
+
+class APITestCase(unittest.TestCase):
+    """
+    :type self.app: flask.Flask
+    :type self.app_context: flask.ctx.AppContext
+    :type self.client: flask.testing.FlaskClient
+    """
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def get_api_headers(username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode((username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def add_user(self, email='john@example.com', username='john'):
+        user = User(email=email, username=username, password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def add_posts(self, user, count):
+        now = datetime.utcnow()
+        posts = [Post(body='post %d' % i, author=user, timestamp=now - timedelta(minutes=i)) for i in range(count)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return posts
+
+    def get_json(self, url, headers):
+        # the test client drops the query string of absolute urls, such as the api's `prev`/`next` links
+        response = self.client.get(url.replace('http://localhost', ''), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_data(as_text=True))
+
+    def test_no_auth(self):
+        response = self.client.get(url_for('api.get_posts'), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cursor_pagination_walks_every_post_once(self):
+        user = self.add_user()
+        self.add_posts(user, 45)
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        seen = []
+        url = url_for('api.get_user_posts', user_id=user.id, cursor='')
+        while url:
+            page = self.get_json(url, headers)
+            self.assertEqual(page['count'], 45)
+            seen.extend(post['body'] for post in page['posts'])
+            url = page['next']
+        self.assertEqual(seen, ['post %d' % i for i in range(45)])
+
+    def test_cursor_pagination_prev_returns_previous_page(self):
+        user = self.add_user()
+        self.add_posts(user, 45)
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        first = self.get_json(url_for('api.get_user_posts', user_id=user.id, cursor='', count=0), headers)
+        self.assertIsNone(first['prev'])
+        self.assertIn('count=0', first['next'])
+        second = self.get_json(first['next'], headers)
+        self.assertIsNone(second['count'])
+        back = self.get_json(second['prev'], headers)
+        self.assertEqual(back['posts'], first['posts'])
+
+    def test_password_change_bypasses_credential_cache(self):
+        user = self.add_user()
+        old_headers = self.get_api_headers('john@example.com', 'cat')
+        for _ in range(2):
+            self.assertEqual(self.client.get(url_for('api.get_posts'), headers=old_headers).status_code, 200)
+
+        user.password = 'dog'
+        db.session.commit()
+        response = self.client.get(url_for('api.get_posts'), headers=old_headers)
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(url_for('api.get_posts'), headers=self.get_api_headers('john@example.com', 'dog'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_repeat_requests_skip_the_password_kdf(self):
+        self.add_user()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        with mock.patch.object(User, 'verify_password', autospec=True, side_effect=User.verify_password) as kdf:
+            for _ in range(3):
+                self.assertEqual(self.client.get(url_for('api.get_posts'), headers=headers).status_code, 200)
+            wrong_headers = self.get_api_headers('john@example.com', 'dog')
+            self.assertEqual(self.client.get(url_for('api.get_posts'), headers=wrong_headers).status_code, 401)
+        self.assertEqual(kdf.call_count, 2)
+
+    def test_user_without_a_password_cannot_authenticate(self):
+        db.session.add(User(email='nopw@example.com', username='nopw', confirmed=True))
+        db.session.commit()
+        headers = self.get_api_headers('nopw@example.com', 'anything')
+        for _ in range(2):
+            self.assertEqual(self.client.get(url_for('api.get_posts'), headers=headers).status_code, 401)
+
+    def test_token_reads_skip_user_lookup(self):
+        user = self.add_user()
+        post, = self.add_posts(user, 1)
+        headers = self.get_api_headers(user.generate_auth_token(expiration=3600), '')
+
+        queries = len(get_debug_queries())
+        response = self.client.get(url_for('api.get_post', post_id=post.id), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        statements = [query.statement for query in get_debug_queries()[queries:]]
+        self.assertFalse([statement for statement in statements if 'FROM users' in statement], statements)
+
+        response = self.client.put(url_for('api.edit_post', post_id=post.id), headers=headers,
+                                   data=json.dumps({'body': 'edited'}))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url_for('api.get_posts'), headers=self.get_api_headers('bad-token', ''))
+        self.assertEqual(response.status_code, 401)
+
+    def test_conditional_get(self):
+        user = self.add_user()
+        post, = self.add_posts(user, 1)
+        headers = self.get_api_headers('john@example.com', 'cat')
+        for url in (url_for('api.get_post', post_id=post.id), url_for('api.get_posts')):
+            response = self.client.get(url, headers=headers)
+            etag = response.headers['ETag']
+            response = self.client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.get_data(), b'')
+
+        post.body = 'edited'
+        db.session.commit()
+        response = self.client.get(url_for('api.get_posts'), headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_external_url_matches_url_for(self):
+        for root in ('http://localhost/', 'https://example.com:8443/'):
+            with self.app.test_request_context(base_url=root):
+                for post_id in (1, 42, 1000000):
+                    for endpoint in ('api.get_post', 'api.get_post_comments'):
+                        self.assertEqual(external_url(endpoint, post_id=post_id),
+                                         url_for(endpoint, post_id=post_id, _external=True))
+
+    def test_fields_and_embed(self):
+        user = self.add_user()
+        posts = self.add_posts(user, 3)
+        db.session.add_all([Comment(body='comment', post=posts[0], author=user) for _ in range(2)])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        page = self.get_json(url_for('api.get_posts', fields='body,timestamp', embed='author,comments'), headers)
+        self.assertEqual(set(page['posts'][0]), {'body', 'timestamp', 'author', 'comments', 'comments_url'})
+        self.assertEqual(page['posts'][0]['author']['username'], 'john')
+        self.assertEqual([len(post['comments']) for post in page['posts']], [2, 0, 0])
+        self.assertEqual(page['posts'][0]['comments_url'],
+                         url_for('api.get_post_comments', post_id=posts[0].id, _external=True))
+
+        self.app.config['FLASKY_COMMENTS_PER_PAGE'] = 1
+        post = self.get_json(url_for('api.get_post', post_id=posts[0].id, embed='comments'), headers)
+        self.assertEqual([comment['url'] for comment in post['comments']],
+                         [url_for('api.get_comment', comment_id=max(comment.id for comment in posts[0].comments),
+                                  _external=True)])
+
+        response = self.client.get(url_for('api.get_post', post_id=posts[0].id, fields='bogus', _external=False),
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url_for('api.get_comments', embed='comments', _external=False), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_multi_get(self):
+        john = self.add_user()
+        susan = self.add_user('susan@example.com', 'susan')
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        ids = '%d,999,%d' % (susan.id, john.id)
+        users = self.get_json(url_for('api.get_users', ids=ids), headers)
+        self.assertEqual([user['username'] for user in users['users']], ['susan', 'john'])
+        self.assertEqual(users['missing'], [999])
+        self.assertEqual([user['followed_by_me'] for user in users['users']], [False, True])
+
+        john.follow(susan)
+        db.session.commit()
+        users = self.get_json(url_for('api.get_users', ids=ids, fields='username,followed_by_me'), headers)
+        self.assertEqual(users['users'][0], {'username': 'susan', 'followed_by_me': True})
+
+        self.app.config['FLASKY_API_MAX_IDS'] = 2
+        response = self.client.get(url_for('api.get_posts', ids=ids, _external=False), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_streams_ndjson(self):
+        admin = self.add_user('admin@flasky.com', 'admin')
+        posts = self.add_posts(admin, 5)
+        headers = self.get_api_headers('admin@flasky.com', 'cat')
+
+        response = self.client.get(url_for('api.export', name='posts', since=posts[1].id, _external=False),
+                                   headers=headers)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['body'] for row in rows], ['post 2', 'post 3', 'post 4'])
+
+        since = posts[3].timestamp.isoformat()
+        response = self.client.get(url_for('api.export', name='posts', since=since, _external=False), headers=headers)
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['body'] for row in rows], ['post 3', 'post 2', 'post 1', 'post 0'])
+
+        # a row tied on the timestamp of the last one exported is not skipped
+        posts[2].timestamp = posts[3].timestamp
+        db.session.commit()
+        since = '%s,%d' % (posts[2].timestamp.isoformat(), posts[2].id)
+        response = self.client.get(url_for('api.export', name='posts', since=since, _external=False), headers=headers)
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['body'] for row in rows], ['post 3', 'post 1', 'post 0'])
+
+        response = self.client.get(url_for('api.export', name='posts', since='yesterday', _external=False),
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.add_user()
+        response = self.client.get(url_for('api.export', name='comments'),
+                                   headers=self.get_api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_search_ranks_matching_posts(self):
+        user = self.add_user()
+        db.session.add_all([Post(body='a fox', author=user), Post(body='fox, fox and fox', author=user),
+                            Post(body='a dog', author=user)])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+
+        results = self.get_json(url_for('api.search', q='fox'), headers)
+        self.assertEqual([post['body'] for post in results['posts']], ['fox, fox and fox', 'a fox'])
+        self.assertEqual(results['count'], 2)
+        results = self.get_json(url_for('api.search', q='do', type='comments'), headers)
+        self.assertEqual(results['comments'], [])
+
+        self.assertEqual(indexes['posts'].rebuild(), 3)
+        results = self.get_json(url_for('api.search', q='fox'), headers)
+        self.assertEqual(results['count'], 2)
+
+    def test_invalid_cursor(self):
+        self.add_user()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.get(url_for('api.get_posts', cursor='garbage', _external=False), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
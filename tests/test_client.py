@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import os
+import re
 import unittest
 
 from flask import url_for
+from flask.ext.sqlalchemy import get_debug_queries
 
-from app import create_app, db
-from app.models import Role, User
+from app import create_app, db, fragment_cache, instrumentation
+from app.models import Role, User, Post, Comment
 
 
 class FlaskClientTestCase(unittest.TestCase):
@@ -63,5 +66,136 @@ class FlaskClientTestCase(unittest.TestCase):
         data = response.get_data(as_text=True)
         self.assertIn('You have been logged out', data)
 
-        if __name__ == '__main__':
-            unittest.main()
+    def test_views_stay_within_query_budget(self):
+        # TestingConfig sets FLASKY_QUERY_BUDGET_STRICT, so an N+1 regression turns these pages into 500s
+        admin = User(email='admin@flasky.com', username='admin', password='secret', confirmed=True)
+        users = [User(email='user%d@test.com' % i, username='user%d' % i, password='secret') for i in range(10)]
+        db.session.add_all([admin] + users)
+        db.session.commit()
+        for i in range(30):
+            post = Post(body='post %d' % i, author=users[i % 10])
+            db.session.add(post)
+            db.session.add_all([Comment(body='comment', post=post, author=user) for user in users[:3]])
+        for user in users:
+            user.follow(users[1])
+            admin.follow(user)
+        db.session.commit()
+
+        self.client.post(url_for('auth.login'), data={'email': 'admin@flasky.com', 'password': 'secret'})
+        for url in (url_for('main.index'), url_for('main.user_profile', username='user1'),
+                    url_for('main.show_post', post_id=1), url_for('main.moderate'),
+                    url_for('main.followers', username='user1'), url_for('main.followed_by', username='admin'),
+                    url_for('main.search', q='post', _external=False)):
+            # what the teardown of a request's own app context would do, so rows are not already loaded
+            db.session.remove()
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_post_fragments_are_cached_and_invalidated(self):
+        fragment_cache.cache.clear()
+        john = User(email='john@test.com', username='john', password='cat', confirmed=True)
+        post = Post(body='first body', author=john)
+        db.session.add_all([john, post])
+        db.session.commit()
+
+        gravatar, calls = User.gravatar, []
+        User.gravatar = lambda *args, **kwargs: calls.append(args) or gravatar(*args, **kwargs)
+        try:
+            for _ in range(2):
+                self.assertIn('first body', self.client.get(url_for('main.index')).get_data(as_text=True))
+        finally:
+            User.gravatar = gravatar
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(fragment_cache.cache), 1)
+
+        post.body = 'second body'
+        db.session.commit()
+        self.assertIn('second body', self.client.get(url_for('main.index')).get_data(as_text=True))
+        john.username = 'johnny'
+        db.session.commit()
+        self.assertEqual(len(fragment_cache.cache), 0)
+        self.assertIn('johnny', self.client.get(url_for('main.index')).get_data(as_text=True))
+
+    def test_search_page(self):
+        john = User(email='john@test.com', username='john', password='cat', confirmed=True)
+        post = Post(body='searchable words', author=john)
+        db.session.add_all([john, post, Comment(body='a searchable comment', post=post, author=john)])
+        db.session.commit()
+
+        data = self.client.get(url_for('main.search', q='search', _external=False)).get_data(as_text=True)
+        self.assertIn('searchable words', data)
+        response = self.client.get(url_for('main.search', q='search', type='comments', _external=False))
+        data = response.get_data(as_text=True)
+        self.assertIn('a searchable comment', data)
+        self.assertEqual(self.client.get(url_for('main.search', q='x', type='users', _external=False)).status_code, 404)
+
+    def test_get_requests_read_from_the_replica_until_the_client_writes(self):
+        replica_uri = self.app.config['SQLALCHEMY_DATABASE_URI'].replace('db-test', 'db-test-replica')
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica': replica_uri}
+        self.app.config['FLASKY_DB_REPLICAS'] = ('replica',)
+        replica = db.get_engine(self.app, 'replica')
+        db.metadata.create_all(replica)
+        try:
+            john = User(email='john@test.com', username='john', password='cat', confirmed=True)
+            susan = User(email='susan@test.com', username='susan', password='cat', confirmed=True)
+            db.session.add_all([john, susan])
+            db.session.commit()
+            # the replica has the users but lags behind on their posts
+            for table in (Role.__table__, User.__table__):
+                replica.execute(table.insert(), [dict(row) for row in db.engine.execute(table.select())])
+            db.session.add(Post(body='not replicated yet', author=susan))
+            db.session.commit()
+
+            self.client.post(url_for('auth.login'), data={'email': 'john@test.com', 'password': 'cat'})
+            self.assertNotIn('not replicated yet', self.client.get(url_for('main.index')).get_data(as_text=True))
+            # a GET that writes pins the client to the primary as much as a POST would
+            self.client.get(url_for('main.follow', username='susan'))
+            self.assertIn('not replicated yet', self.client.get(url_for('main.index')).get_data(as_text=True))
+        finally:
+            db.session.remove()
+            db.metadata.drop_all(replica)
+            replica.dispose()
+            self.app.config.update(SQLALCHEMY_BINDS=None, FLASKY_DB_REPLICAS=())
+            os.remove(replica_uri[len('sqlite:///'):])
+
+    def test_instrumentation_times_requests(self):
+        self.app.config.update(FLASKY_INSTRUMENTATION=True, FLASKY_SLOW_REQUEST_MS=0)
+        instrumentation.init_app(self.app)
+        admin = User(email='admin@flasky.com', username='admin', password='cat', confirmed=True)
+        john = User(email='john@test.com', username='john', password='cat', confirmed=True)
+        db.session.add_all([admin, john])
+        db.session.commit()
+
+        # the first request also runs the app's warm-up, which is not timed
+        self.client.get(url_for('main.index'))
+        queries = len(get_debug_queries())
+        response = self.client.get(url_for('main.index'))
+        count, render_time = re.match(r'^db;dur=[\d.]+;desc="(\d+) queries", render;dur=([\d.]+), total;',
+                                      response.headers['Server-Timing']).groups()
+        self.assertEqual(int(count), len(get_debug_queries()) - queries)
+        self.assertGreater(int(count), 0)
+        self.assertGreater(float(render_time), 0)
+
+        # a write's flush runs before the timing ends
+        self.client.post(url_for('auth.login'), data={'email': 'admin@flasky.com', 'password': 'cat'})
+        queries = len(get_debug_queries())
+        response = self.client.post(url_for('main.index'), data={'body': 'a timed post'})
+        count = int(re.search(r'"(\d+) queries"', response.headers['Server-Timing']).group(1))
+        statements = [query.statement for query in get_debug_queries()[queries:]]
+        self.assertEqual(count, len(statements))
+        self.assertTrue(any(statement.startswith('INSERT INTO posts') for statement in statements))
+        self.client.get(url_for('auth.logout'))
+
+        self.client.post(url_for('auth.login'), data={'email': 'john@test.com', 'password': 'cat'})
+        self.assertEqual(self.client.get(url_for('main.slow_requests')).status_code, 403)
+        self.client.get(url_for('auth.logout'))
+        self.client.post(url_for('auth.login'), data={'email': 'admin@flasky.com', 'password': 'cat'})
+        data = self.client.get(url_for('main.slow_requests')).get_data(as_text=True)
+        self.assertIn('GET /?', data)
+
+        totals = [timing.total for timing in instrumentation.slowest()]
+        instrumentation.resize(2)
+        self.assertEqual([timing.total for timing in instrumentation.slowest()], sorted(totals, reverse=True)[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
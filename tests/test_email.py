@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import asyncore
+import smtpd
+import unittest
+from threading import Thread
+
+from flask.ext.mail import Message
+
+from app import create_app
+from app.email import MailPool, mail_pool, send_email
+
+
+class SMTPStandIn(smtpd.SMTPServer):
+    """Local SMTP server that records messages and counts connections."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), None, decode_data=True)
+        self.port = self.socket.getsockname()[1]
+        self.connections = 0
+        self.messages = []
+
+    def handle_accepted(self, conn, addr):
+        self.connections += 1
+        super().handle_accepted(conn, addr)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append((rcpttos, data))
+
+
+class MailPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(FLASKY_MAIL_WORKERS=1, FLASKY_MAIL_BATCH_SIZE=10)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.server = SMTPStandIn()
+        self.serving = True
+        self.loop = Thread(target=self.serve)
+        self.loop.start()
+        state = self.app.extensions['mail']
+        state.server, state.port, state.suppress = '127.0.0.1', self.server.port, False
+
+    def tearDown(self):
+        self.serving = False
+        self.loop.join()
+        self.server.close()
+        self.app_context.pop()
+
+    def serve(self):
+        while self.serving:
+            asyncore.loop(timeout=.05, count=1)
+
+    def test_batch_shares_a_connection(self):
+        with self.app.test_request_context():
+            messages = [Message('hello', sender='admin@example.com', recipients=['user%d@example.com' % i], body='hi')
+                        for i in range(5)]
+        MailPool._deliver(self.app, messages)
+
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_send_email_drains_on_shutdown(self):
+        with self.app.test_request_context():
+            for i in range(5):
+                send_email('user%d@example.com' % i, 'Confirm Your Account', 'mail/confirm',
+                           user={'username': 'john'}, token='token')
+        mail_pool.shutdown()
+
+        self.assertEqual(sorted(rcpttos for rcpttos, _ in self.server.messages),
+                         [['user%d@example.com' % i] for i in range(5)])
+
+    def test_unsendable_message_is_skipped(self):
+        with self.app.test_request_context():
+            messages = [Message('hello\nBcc: everyone@example.com', sender='admin@example.com',
+                                recipients=['user0@example.com'], body='hi'),
+                        Message('hello', sender='admin@example.com', recipients=[], body='hi'),
+                        Message('hello', sender='admin@example.com', recipients=['user1@example.com'], body='hi')]
+            for msg in messages:
+                mail_pool.submit(msg)
+        mail_pool.shutdown()
+
+        self.assertEqual([rcpttos for rcpttos, _ in self.server.messages], [['user1@example.com']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import unittest
+from datetime import datetime, timedelta
+
+from flask.ext.sqlalchemy import get_debug_queries
+
+from app import create_app, db, follow_graph, last_seen_buffer, render_cache
+from app.cache import LRUCache
+from app.fake import FakeDataGenerator
+from app.models import AnonymousUser, Follow, Permission, Role, User, Post, Comment, TimelineEntry, rerender
+from app.search import indexes
+
+
+class ModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def add_users(*usernames):
+        users = [User(email='%s@example.com' % username, username=username, password='cat') for username in usernames]
+        db.session.add_all(users)
+        db.session.commit()
+        return users
+
+
+class CounterTestCase(ModelTestCase):
+    def test_counters_follow_inserts_and_deletes(self):
+        john, susan = self.add_users('john', 'susan')
+        post = Post(body='post', author=john)
+        db.session.add(post)
+        db.session.add_all([Comment(body='comment', post=post, author=susan) for _ in range(3)])
+        john.follow(susan)
+        db.session.commit()
+
+        self.assertEqual(john.post_count, 1)
+        self.assertEqual(post.comment_count, 3)
+        self.assertEqual(susan.comment_count, 3)
+        self.assertEqual(john.followed_count, 2)
+        self.assertEqual(susan.follower_count, 2)
+
+        john.unfollow(susan)
+        db.session.delete(post.comments.first())
+        db.session.commit()
+
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(john.followed_count, 1)
+        self.assertEqual(susan.follower_count, 1)
+
+    def test_rebuild_counters(self):
+        john, = self.add_users('john')
+        db.session.add_all([Post(body='post', author=john) for _ in range(5)])
+        db.session.commit()
+        db.session.execute(User.__table__.update().values(post_count=0, follower_count=0))
+        db.session.commit()
+
+        User.rebuild_counters(chunk_size=2)
+        db.session.refresh(john)
+        self.assertEqual(john.post_count, 5)
+        self.assertEqual(john.follower_count, 1)
+
+
+class TimelineTestCase(ModelTestCase):
+    @staticmethod
+    def timeline(user):
+        query = user.timeline.order_by(TimelineEntry.timestamp.desc(), TimelineEntry.post_id.desc())
+        return [post.body for post in query]
+
+    def test_timeline_follows_posts_and_follows(self):
+        john, susan, david = self.add_users('john', 'susan', 'david')
+        db.session.add_all([Post(body='susan 1', author=susan), Post(body='david 1', author=david)])
+        john.follow(susan)
+        db.session.commit()
+        self.assertEqual(set(self.timeline(john)), {'susan 1'})
+
+        db.session.add(Post(body='susan 2', author=susan))
+        db.session.add(Post(body='john 1', author=john))
+        john.follow(david)
+        db.session.commit()
+        self.assertEqual(set(self.timeline(john)), {'susan 1', 'susan 2', 'david 1', 'john 1'})
+        self.assertEqual(set(self.timeline(susan)), {'susan 1', 'susan 2'})
+
+        john.unfollow(susan)
+        db.session.commit()
+        self.assertEqual(set(self.timeline(john)), {'david 1', 'john 1'})
+
+    def test_backfill_matches_followed_posts(self):
+        john, susan = self.add_users('john', 'susan')
+        db.session.add_all([Post(body='post %d' % i, author=susan) for i in range(5)])
+        john.follow(susan)
+        db.session.commit()
+        TimelineEntry.query.delete()
+        db.session.commit()
+
+        TimelineEntry.backfill(chunk_size=1)
+        self.assertEqual(sorted(self.timeline(john)), sorted(post.body for post in john.followed_posts))
+
+
+class RenderCacheTestCase(ModelTestCase):
+    def test_duplicate_bodies_render_once(self):
+        render_cache.cache.clear()
+        john, = self.add_users('john')
+        posts = [Post(body='*spam* http://example.com', author=john) for _ in range(10)]
+        db.session.add_all(posts)
+        db.session.add(Comment(body='*spam* http://example.com', post=posts[0], author=john))
+        db.session.commit()
+
+        self.assertEqual(len(render_cache.cache), 2)
+        self.assertEqual(len(set(post.body_html for post in posts)), 1)
+        self.assertIn('<em>spam</em>', posts[0].body_html)
+        self.assertIn('href="http://example.com"', posts[0].body_html)
+
+    def test_unchanged_body_is_not_rerendered(self):
+        john, = self.add_users('john')
+        post = Post(body='body', author=john)
+        db.session.add(post)
+        db.session.commit()
+
+        post.body_html = '<p>kept</p>'
+        post.body = 'body'
+        self.assertEqual(post.body_html, '<p>kept</p>')
+        post.body = 'new body'
+        self.assertEqual(post.body_html, '<p>new body</p>')
+
+    def test_rerender_restores_body_html(self):
+        john, = self.add_users('john')
+        db.session.add_all([Post(body='post **%d**' % i, author=john) for i in range(7)])
+        db.session.commit()
+        db.session.execute(Post.__table__.update().where(Post.id > 2).values(body_html=None))
+        db.session.commit()
+
+        rerender(Post, chunk_size=3, workers=2, start_after=2)
+        self.assertEqual([post.body_html for post in Post.query.order_by(Post.id)],
+                         ['<p>post <strong>%d</strong></p>' % i for i in range(7)])
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+
+
+class FollowGraphTestCase(ModelTestCase):
+    def test_follow_checks_skip_the_database(self):
+        john, susan, david = self.add_users('john', 'susan', 'david')
+        john.follow(susan)
+        susan.follow(john)
+        db.session.commit()
+        self.assertTrue(john.is_following(susan))
+        db.session.refresh(david)
+
+        queries = len(get_debug_queries())
+        self.assertTrue(follow_graph.is_mutual(john.id, susan.id))
+        self.assertFalse(john.is_following(david))
+        self.assertTrue(susan.is_followed_by(john))
+        self.assertEqual(follow_graph.follower_count(susan.id), 2)
+        self.assertEqual(len(get_debug_queries()), queries)
+
+    def test_changes_apply_on_commit_only(self):
+        john, susan = self.add_users('john', 'susan')
+        self.assertFalse(john.is_following(susan))
+        john.follow(susan)
+        db.session.rollback()
+        self.assertFalse(john.is_following(susan))
+
+        john.follow(susan)
+        db.session.commit()
+        self.assertTrue(john.is_following(susan))
+        john.unfollow(susan)
+        db.session.commit()
+        self.assertFalse(john.is_following(susan))
+        self.assertEqual(follow_graph.followed_count(john.id), 1)
+
+    def test_follow_writes_check_the_database(self):
+        john, susan = self.add_users('john', 'susan')
+        self.assertFalse(john.is_following(susan))
+        # another process follows; this one's graph has not reloaded yet
+        db.engine.execute(Follow.__table__.insert().values(follower_id=john.id, followed_id=susan.id))
+        self.assertFalse(john.is_following(susan))
+
+        john.follow(susan)
+        db.session.commit()
+        john.unfollow(susan)
+        db.session.commit()
+        self.assertEqual(john.followed.filter_by(followed_id=susan.id).count(), 0)
+
+    def test_stale_graph_reloads_in_the_background(self):
+        john, susan = self.add_users('john', 'susan')
+        self.assertFalse(john.is_following(susan))
+        db.engine.execute(Follow.__table__.insert().values(follower_id=john.id, followed_id=susan.id))
+
+        follow_graph.loaded_at -= self.app.config['FLASKY_FOLLOW_GRAPH_TTL']
+        self.assertFalse(john.is_following(susan))
+        follow_graph.refresher.join()
+        self.assertTrue(john.is_following(susan))
+
+    def test_following_status_for_a_page_of_users(self):
+        john, susan, david = self.add_users('john', 'susan', 'david')
+        john.follow(susan)
+        david.follow(john)
+        db.session.commit()
+        self.assertTrue(john.is_following(susan))
+        db.session.refresh(david)
+
+        queries = len(get_debug_queries())
+        status = john.following_status([susan, david, john])
+        self.assertEqual(len(get_debug_queries()), queries)
+        self.assertEqual(status[susan.id], (True, False))
+        self.assertEqual(status[david.id], (False, True))
+        self.assertEqual(AnonymousUser().following_status([susan])[susan.id], (False, False))
+
+
+class LastSeenTestCase(ModelTestCase):
+    def tearDown(self):
+        last_seen_buffer.stop()
+        super(LastSeenTestCase, self).tearDown()
+
+    def test_pings_are_coalesced_and_written_in_one_flush(self):
+        self.app.config['FLASKY_LAST_SEEN_FLUSH_INTERVAL'] = 3600
+        john, susan = self.add_users('john', 'susan')
+        then = datetime.utcnow() + timedelta(minutes=5)
+        for user in (john, susan, john):
+            last_seen_buffer.touch(user, now=then)
+        self.assertFalse(db.session.dirty)
+        self.assertEqual(len(last_seen_buffer.pending[self.app]), 2)
+
+        last_seen_buffer.flush()
+        db.session.expire_all()
+        self.assertEqual([john.last_seen, susan.last_seen], [then, then])
+
+        last_seen_buffer.touch(john, now=then + timedelta(seconds=1))
+        self.assertFalse(last_seen_buffer.pending)
+
+        thread = last_seen_buffer.thread
+        last_seen_buffer.stop()
+        self.assertFalse(thread.is_alive())
+
+
+class PermissionCacheTestCase(ModelTestCase):
+    def test_permission_checks_skip_the_roles_table(self):
+        john, = self.add_users('john')
+        db.session.expire_all()
+        john.can(Permission.FOLLOW)
+
+        queries = len(get_debug_queries())
+        self.assertTrue(john.can(Permission.WRITE_ARTICLES))
+        self.assertFalse(john.is_admin)
+        self.assertEqual(len(get_debug_queries()), queries)
+
+    def test_role_changes_invalidate_the_cache(self):
+        john, = self.add_users('john')
+        self.assertFalse(john.can(Permission.MODERATE_COMMENTS))
+        john.role.permissions |= Permission.MODERATE_COMMENTS
+        db.session.commit()
+        self.assertTrue(john.can(Permission.MODERATE_COMMENTS))
+
+        john.role = Role.query.filter_by(name='Administrator').first()
+        self.assertTrue(john.is_admin)
+
+    def test_cache_expires_after_its_ttl(self):
+        john, = self.add_users('john')
+        self.assertFalse(john.can(Permission.MODERATE_COMMENTS))
+        # as another process would, behind this one's listeners
+        db.engine.execute(Role.__table__.update().where(Role.id == john.role_id).values(permissions=0xff))
+        self.assertFalse(john.can(Permission.MODERATE_COMMENTS))
+
+        Role._permissions_loaded_at -= self.app.config['FLASKY_PERMISSIONS_CACHE_TTL']
+        self.assertTrue(john.can(Permission.MODERATE_COMMENTS))
+
+
+class FakeDataTestCase(ModelTestCase):
+    def generate(self):
+        FakeDataGenerator(users=20, posts=50, comments=80, follows=3, seed=7, batch_size=16, body_pool=10,
+                          now=datetime(2020, 1, 1)).run()
+        # every run salts the shared password hash afresh
+        columns = [column for column in User.__table__.columns if column.name != 'password_hash']
+        return [db.session.execute(db.select(columns).order_by(*columns)).fetchall()] + [
+            db.session.execute(table.select().order_by(*table.columns)).fetchall()
+            for table in (Follow.__table__, Post.__table__, Comment.__table__, TimelineEntry.__table__)]
+
+    def test_same_seed_same_rows(self):
+        first = self.generate()
+        self.assertEqual([len(rows) for rows in first[:1] + first[2:4]], [20, 50, 80])
+        db.drop_all()
+        db.create_all()
+        Role.insert_roles()
+        self.assertEqual(self.generate(), first)
+
+    def test_counters_timelines_and_indexes_are_rebuilt(self):
+        self.generate()
+        for user in User.query:
+            self.assertEqual((user.post_count, user.comment_count, user.follower_count, user.followed_count),
+                             (user.posts.count(), user.comments.count(), user.follower.count(),
+                              user.followed.count()))
+        for post in Post.query:
+            self.assertEqual(post.comment_count, post.comments.count())
+        followed_posts = sum(user.followed_posts.count() for user in User.query)
+        self.assertEqual(TimelineEntry.query.count(), followed_posts)
+        self.assertEqual(db.session.execute(db.select([db.func.count()]).select_from(
+            indexes['posts'].table)).scalar(), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()